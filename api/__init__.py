@@ -3,13 +3,15 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-import json
-
-from flask import Flask
+from flask import Flask, g
 from flask_cors import CORS
 
 from .routes import rest_api
-from .models import db
+from .models import db, has_pending_writes
+from . import database  # registers the SQLite pragma listener
+from .commands import commands
+from .compression import compress_response
+from .migrations import upgrade
 
 app = Flask(__name__)
 
@@ -19,26 +21,38 @@ db.init_app(app)
 rest_api.init_app(app)
 CORS(app)
 
+for command in commands:
+    app.cli.add_command(command)
+
 # Setup database
 @app.before_first_request
 def initialize_database():
     db.create_all()
+    upgrade(db.engine)
 
 """
-   Custom responses
+   Unit of work: handlers stage their changes, the request commits once
 """
 
+@app.before_request
+def begin_unit_of_work():
+    g.unit_of_work = app.config['UNIT_OF_WORK']
+    g.commit_count = 0
+
 @app.after_request
-def after_request(response):
-    """
-       Sends back a custom error with {"success", "msg"} format
-    """
-
-    if int(response.status_code) >= 400:
-        response_data = json.loads(response.get_data())
-        if "errors" in response_data:
-            response_data = {"success": False,
-                             "msg": list(response_data["errors"].items())[0][1]}
-            response.set_data(json.dumps(response_data))
-        response.headers.add('Content-Type', 'application/json')
+def end_unit_of_work(response):
+    if g.get('unit_of_work'):
+        g.unit_of_work = False
+        if response.status_code < 400 and has_pending_writes():
+            db.session.commit()
+        else:
+            db.session.rollback()
+    if app.debug or app.config['DEBUG_COMMIT_COUNT']:
+        response.headers['X-DB-Commits'] = str(g.get('commit_count', 0))
     return response
+
+"""
+   Response compression, negotiated with Accept-Encoding
+"""
+
+app.after_request(compress_response)
@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import math
+import threading
+import time
+
+from datetime import datetime
+
+from .config import BaseConfig
+from .models import db, JWTTokenBlocklist
+
+
+class BloomFilter():
+    '''
+        Bloom filter over hex digests. The items are already uniformly
+        distributed hashes, so the bit positions are derived from the digest
+        itself by double hashing instead of hashing it again.
+    '''
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def estimated_error_rate(self):
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def _positions(self, digest):
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+
+class RevocationFilter():
+    '''
+        Bloom filter of revoked token digests kept in front of the blocklist
+        table, so the database is only consulted when the filter reports a
+        possible match. Revocations made by other workers are picked up by
+        checking, at most once per sync interval, for blocklist rows newer
+        than the last id this worker has seen.
+    '''
+
+    def __init__(self, capacity, error_rate, sync_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.checks = 0
+        self.positives = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def might_be_revoked(self, digest):
+        self.sync()
+        self.checks += 1
+        if digest in self._bloom:
+            self.positives += 1
+            return True
+        return False
+
+    def record_false_positive(self):
+        self.false_positives += 1
+
+    def add(self, digest):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(digest)
+
+    def sync(self):
+        if self._bloom is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._bloom is None or self._bloom.count >= self._bloom.capacity:
+                self._rebuild()
+            else:
+                new_rows = db.session.query(JWTTokenBlocklist.id, JWTTokenBlocklist.token_hash) \
+                                     .filter(JWTTokenBlocklist.id > self._last_id) \
+                                     .order_by(JWTTokenBlocklist.id).all()
+                for row in new_rows:
+                    self._bloom.add(row.token_hash)
+                    self._last_id = row.id
+            self._synced_at = time.monotonic()
+
+    def _rebuild(self):
+        # read before the rows, a revocation committed in between is then seen again by the next sync
+        last_id = db.session.query(db.func.max(JWTTokenBlocklist.id)).scalar() or 0
+        live_rows = db.session.query(JWTTokenBlocklist.id, JWTTokenBlocklist.token_hash) \
+                              .filter(JWTTokenBlocklist.expires_at > datetime.utcnow()).all()
+        bloom = BloomFilter(max(self.capacity, len(live_rows) * 2), self.error_rate)
+        for row in live_rows:
+            bloom.add(row.token_hash)
+        self._last_id = last_id
+        self._bloom = bloom
+        self.rebuilds += 1
+
+    def stats(self):
+        bloom = self._bloom
+        return {"items": bloom.count if bloom else 0,
+                "size_bits": bloom.size if bloom else 0,
+                "hash_count": bloom.hash_count if bloom else 0,
+                "target_error_rate": self.error_rate,
+                "estimated_error_rate": round(bloom.estimated_error_rate(), 6) if bloom else 0.0,
+                "generation": self._last_id,
+                "checks": self.checks,
+                "positives": self.positives,
+                "false_positives": self.false_positives,
+                "rebuilds": self.rebuilds}
+
+
+revocation_filter = RevocationFilter(BaseConfig.BLOCKLIST_FILTER_CAPACITY,
+                                     BaseConfig.BLOCKLIST_FILTER_ERROR_RATE,
+                                     BaseConfig.BLOCKLIST_FILTER_SYNC_INTERVAL)
@@ -0,0 +1,357 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .config import BaseConfig
+
+
+class CacheBackend(ABC):
+    '''
+        Interface of the caches. Keys are strings, values must be JSON serializable
+        so that they can be shared between processes. Entries can carry tags so that
+        every entry related to e.g. a user can be dropped at once.
+    '''
+
+    @abstractmethod
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key, value, ttl=None, tags=()):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def invalidate_tag(self, tag):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self):
+        raise NotImplementedError
+
+
+class TTLCache(CacheBackend):
+    '''
+        Thread-safe, size bounded LRU cache of one process whose entries expire after a TTL
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "maxsize": self.maxsize,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+_MISSING = object()
+
+_SHARED_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, tags TEXT NOT NULL, expires_at REAL NOT NULL, '
+    'PRIMARY KEY (namespace, key)) WITHOUT ROWID;'
+    'CREATE INDEX IF NOT EXISTS ix_cache_entry_expires_at ON cache_entry (namespace, expires_at);'
+    'CREATE TABLE IF NOT EXISTS cache_tag ('
+    'namespace TEXT NOT NULL, tag TEXT NOT NULL, key TEXT NOT NULL, '
+    'PRIMARY KEY (namespace, tag, key)) WITHOUT ROWID;'
+    'CREATE INDEX IF NOT EXISTS ix_cache_tag_key ON cache_tag (namespace, key);'
+    'CREATE TABLE IF NOT EXISTS cache_event ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, kind TEXT NOT NULL, name TEXT, created_at REAL NOT NULL);'
+)
+
+
+class SharedCache(CacheBackend):
+    '''
+        Cache shared by the worker processes of a host through a SQLite file, values
+        are stored as JSON. Each process keeps the entries it used in a local TTLCache
+        in front of the file. Deletes, tag invalidations and clears are applied to the
+        file and appended to an event log, which every process replays into its local
+        cache at most once per sync interval. Events older than the TTL cannot concern
+        a live local entry anymore, so they are pruned together with expired entries.
+        The size bound is approximate, entries closest to expiry are evicted first.
+    '''
+
+    def __init__(self, path, namespace, maxsize, ttl, sync_interval):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.local = TTLCache(maxsize, ttl)
+        self._connection = None
+        self._connection_pid = None
+        self._last_event_id = None
+        self._synced_at = 0.0
+        self._writes = 0
+        self._prune_every = max(maxsize // 8, 1)
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        self.sync()
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        with self._lock:
+            row = self._db().execute('SELECT value, tags, expires_at FROM cache_entry '
+                                     'WHERE namespace = ? AND key = ? AND expires_at > ?',
+                                     (self.namespace, key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        value = json.loads(row[0])
+        self.local.set(key, value, ttl=row[2] - time.time(), tags=json.loads(row[1]))
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock, self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO cache_entry (namespace, key, value, tags, expires_at) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (self.namespace, key, json.dumps(value), json.dumps(list(tags)), time.time() + ttl))
+            connection.execute('DELETE FROM cache_tag WHERE namespace = ? AND key = ?', (self.namespace, key))
+            connection.executemany('INSERT OR IGNORE INTO cache_tag (namespace, tag, key) VALUES (?, ?, ?)',
+                                   [(self.namespace, tag, key) for tag in tags])
+            self._writes += 1
+            if self._writes % self._prune_every == 0:
+                self._prune(connection)
+        self.local.set(key, value, ttl=ttl, tags=tags)
+
+    def delete(self, key):
+        self.local.delete(key)
+        with self._lock, self._transaction() as connection:
+            connection.execute('DELETE FROM cache_entry WHERE namespace = ? AND key = ?', (self.namespace, key))
+            connection.execute('DELETE FROM cache_tag WHERE namespace = ? AND key = ?', (self.namespace, key))
+            self._publish(connection, 'key', key)
+
+    def invalidate_tag(self, tag):
+        self.local.invalidate_tag(tag)
+        with self._lock, self._transaction() as connection:
+            connection.execute('DELETE FROM cache_entry WHERE namespace = ? AND key IN '
+                               '(SELECT key FROM cache_tag WHERE namespace = ? AND tag = ?)',
+                               (self.namespace, self.namespace, tag))
+            connection.execute('DELETE FROM cache_tag WHERE namespace = ? AND tag = ?', (self.namespace, tag))
+            self._publish(connection, 'tag', tag)
+
+    def clear(self):
+        self.local.clear()
+        with self._lock, self._transaction() as connection:
+            connection.execute('DELETE FROM cache_entry WHERE namespace = ?', (self.namespace,))
+            connection.execute('DELETE FROM cache_tag WHERE namespace = ?', (self.namespace,))
+            self._publish(connection, 'clear', None)
+
+    def sync(self):
+        '''
+            Replays the invalidations published by other processes into the local cache
+        '''
+        if time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            events = self._db().execute('SELECT id, kind, name FROM cache_event WHERE namespace = ? AND id > ? ORDER BY id',
+                                        (self.namespace, self._last_event_id)).fetchall()
+            for event_id, kind, name in events:
+                if kind == 'key':
+                    self.local.delete(name)
+                elif kind == 'tag':
+                    self.local.invalidate_tag(name)
+                else:
+                    self.local.clear()
+                self._last_event_id = event_id
+            self._synced_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            size = self._db().execute('SELECT count(*) FROM cache_entry WHERE namespace = ? AND expires_at > ?',
+                                      (self.namespace, time.time())).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "local": self.local.stats()}
+
+    def _db(self):
+        # a connection inherited through fork belongs to the parent process
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BaseConfig.SQLITE_BUSY_TIMEOUT / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(_SHARED_SCHEMA)
+            if self._last_event_id is None:
+                self._last_event_id = connection.execute('SELECT coalesce(max(id), 0) FROM cache_event').fetchone()[0]
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._db()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _publish(self, connection, kind, name):
+        connection.execute('INSERT INTO cache_event (namespace, kind, name, created_at) VALUES (?, ?, ?, ?)',
+                           (self.namespace, kind, name, time.time()))
+
+    def _prune(self, connection):
+        now = time.time()
+        connection.execute('DELETE FROM cache_entry WHERE namespace = ? AND expires_at <= ?', (self.namespace, now))
+        excess = connection.execute('SELECT count(*) FROM cache_entry WHERE namespace = ?',
+                                    (self.namespace,)).fetchone()[0] - self.maxsize
+        if excess > 0:
+            connection.execute('DELETE FROM cache_entry WHERE namespace = ? AND key IN '
+                               '(SELECT key FROM cache_entry WHERE namespace = ? ORDER BY expires_at LIMIT ?)',
+                               (self.namespace, self.namespace, excess))
+            self.evictions += excess
+        connection.execute('DELETE FROM cache_tag WHERE namespace = ? AND key NOT IN '
+                           '(SELECT key FROM cache_entry WHERE namespace = ?)', (self.namespace, self.namespace))
+        connection.execute('DELETE FROM cache_event WHERE namespace = ? AND created_at < ?',
+                           (self.namespace, now - self.ttl - self.sync_interval))
+
+
+def create_cache(namespace, maxsize, ttl):
+    '''
+        Cache of the backend selected with CACHE_BACKEND, namespace separates the caches in a shared file
+    '''
+    if BaseConfig.CACHE_BACKEND == 'local':
+        return TTLCache(maxsize, ttl)
+    if BaseConfig.CACHE_BACKEND == 'shared':
+        return SharedCache(BaseConfig.CACHE_SHARED_PATH, namespace, maxsize, ttl, BaseConfig.CACHE_SYNC_INTERVAL)
+    raise ValueError(f'Unknown cache backend {BaseConfig.CACHE_BACKEND}')
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def project_tag(project_id):
+    return f'project:{project_id}'
+
+
+def project_list_tag(user_id):
+    return f'projects-of:{user_id}'
+
+
+def issue_tag(issue_id):
+    return f'issue:{issue_id}'
+
+
+def project_issues_tag(project_id):
+    return f'issues-of:{project_id}'
+
+
+'''
+    Verified JWT principals keyed by token digest, used by token_required
+'''
+
+token_cache = create_cache('token', BaseConfig.TOKEN_CACHE_SIZE, BaseConfig.TOKEN_CACHE_TTL)
+
+'''
+    Current session version per user, checked against the token's sv claim
+'''
+
+session_versions = create_cache('session_version', BaseConfig.SESSION_VERSION_CACHE_SIZE,
+                                BaseConfig.SESSION_VERSION_CACHE_TTL)
+
+'''
+    Serialized projects and issues returned by the read endpoints, keyed by user and resource
+'''
+
+read_cache = create_cache('read', BaseConfig.READ_CACHE_SIZE, BaseConfig.READ_CACHE_TTL)
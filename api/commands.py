@@ -0,0 +1,68 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import click
+
+from flask.cli import with_appcontext
+
+from .models import db, JWTTokenBlocklist, Project, Issue, IssueBreakdown
+from .migrations import upgrade
+
+
+@click.command('purge-blocklist')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction')
+@with_appcontext
+def purge_blocklist(batch_size):
+    '''
+        Deletes blocklist entries of tokens that are already expired
+    '''
+    purged = JWTTokenBlocklist.purge_expired(batch_size)
+    click.echo(f'Purged {purged} expired tokens, {JWTTokenBlocklist.count()} tokens left in the blocklist')
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade():
+    '''
+        Creates missing tables and applies pending schema migrations
+    '''
+    db.create_all()
+    applied = upgrade(db.engine)
+    for description in applied:
+        click.echo(f'Applied migration: {description}')
+    click.echo(f'{len(applied)} migrations applied')
+
+
+@click.command('reconcile-issue-counts')
+@with_appcontext
+def reconcile_issue_counts():
+    '''
+        Recomputes Project.number_of_issues from the live issues
+    '''
+    corrected = Project.reconcile_issue_counts()
+    click.echo(f'Corrected issue counters of {corrected} projects')
+
+
+@click.command('reconcile-issue-breakdown')
+@with_appcontext
+def reconcile_issue_breakdown():
+    '''
+        Recomputes the per project issue counts by status and type from the live issues
+    '''
+    corrected = IssueBreakdown.reconcile()
+    click.echo(f'Corrected {corrected} issue breakdown rows')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index():
+    '''
+        Rebuilds the full text search index over issue titles
+    '''
+    indexed = Issue.rebuild_search_index()
+    click.echo(f'Indexed {indexed} issues')
+
+
+commands = [purge_blocklist, db_upgrade, reconcile_issue_counts, reconcile_issue_breakdown, rebuild_search_index]
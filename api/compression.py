@@ -0,0 +1,91 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import zlib
+
+from flask import current_app, request
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+'''
+    Negotiated response compression. Buffered bodies are compressed when they
+    reach COMPRESS_MIN_SIZE, streamed bodies (the NDJSON export) always, chunk
+    by chunk, so memory stays flat. A compressed body is a different
+    representation, its strong ETag gets the encoding as suffix and conditional
+    requests compare ETags without it.
+'''
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class _BrotliCompressor():
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def _compressor(encoding, config):
+    if encoding == 'br':
+        return _BrotliCompressor(config['COMPRESS_BROTLI_QUALITY'])
+    # wbits 31 writes the gzip container
+    return zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def strip_encoding_suffix(etag):
+    for encoding in ENCODINGS:
+        if etag.endswith('-' + encoding):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+def compress_response(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304) or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None or request.method == 'HEAD':
+        return response
+
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        close = getattr(response.response, 'close', None)
+        response.response = ClosingIterator(_compress_stream(chunks, _compressor(encoding, config)),
+                                            [close] if close else [])
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressor = _compressor(encoding, config)
+        response.set_data(compressor.compress(data) + compressor.flush())
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
@@ -6,6 +6,8 @@ Copyright (c) 2019 - present AppSeed.us
 import os
 from datetime import timedelta
 
+from sqlalchemy.pool import QueuePool
+
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
 
@@ -13,6 +15,89 @@ class BaseConfig():
 
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'apidata.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Commit once at the end of each request instead of on every save(),
+    # DEBUG_COMMIT_COUNT adds the number of commits as X-DB-Commits response header
+    UNIT_OF_WORK = True
+    DEBUG_COMMIT_COUNT = os.getenv('DEBUG_COMMIT_COUNT', '0') == '1'
+
+    # SQLite engine profile, selected with the DB_PROFILE environment variable.
+    # 'production' runs in WAL mode so readers of one worker are not blocked by writers of another.
+    DB_PROFILE = os.getenv('DB_PROFILE', 'default')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+    SQLITE_PROFILES = {
+        'default': {},
+        'production': {'journal_mode': 'WAL',
+                       'synchronous': 'NORMAL',
+                       'busy_timeout': SQLITE_BUSY_TIMEOUT,
+                       'cache_size': -32000,
+                       'mmap_size': 268435456,
+                       'temp_store': 'MEMORY'},
+    }
+    SQLITE_PRAGMAS = SQLITE_PROFILES[DB_PROFILE]
+    # Flask-SQLAlchemy defaults SQLite files to NullPool, a new connection per checkout
+    SQLALCHEMY_ENGINE_OPTIONS = {} if DB_PROFILE == 'default' else {
+        'poolclass': QueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_POOL_SIZE,
+        'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT / 1000, 'check_same_thread': False},
+    }
     SECRET_KEY = "flask-app-secret-key-change-it"
     JWT_SECRET_KEY = "jwt-app-secret-key-change-it"
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+
+    # Encoder of the JSON responses: 'auto' uses orjson when it is installed, 'orjson' or 'stdlib'
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    # Upper bound of the pre-encoded project and issue fragments kept per process
+    FRAGMENT_CACHE_BYTES = int(os.getenv('FRAGMENT_CACHE_BYTES', 16 * 1024 * 1024))
+
+    # Negotiated gzip (and brotli, when installed) compression of API responses, buffered
+    # bodies below COMPRESS_MIN_SIZE bytes are sent as they are, streamed ones are always compressed
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+    COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson')
+
+    # Backend of the caches below, 'local' keeps them per process, 'shared' in a SQLite file
+    # used by every worker of the host, which replays the others' invalidations each sync interval
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'local')
+    CACHE_SHARED_PATH = os.getenv('CACHE_SHARED_PATH', os.path.join(BASE_DIR, 'cache.db'))
+    CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', 0.2))
+
+    # Verified-token cache used by token_required, entries never outlive the token's exp
+    TOKEN_CACHE_SIZE = 4096
+    TOKEN_CACHE_TTL = 60
+
+    # Per-user session versions checked on every request instead of reading the user row
+    SESSION_VERSION_CACHE_SIZE = 16384
+    SESSION_VERSION_CACHE_TTL = 30
+
+    # Serialized project and issue reads per user, writes drop the affected entries on commit
+    READ_CACHE_SIZE = 16384
+    READ_CACHE_TTL = 30
+
+    # In-memory Bloom filter of revoked tokens in front of the blocklist table
+    BLOCKLIST_FILTER_CAPACITY = 100000
+    BLOCKLIST_FILTER_ERROR_RATE = 0.001
+    BLOCKLIST_FILTER_SYNC_INTERVAL = 1.0
+
+    # Password hashing, stored hashes made with other parameters are upgraded on login.
+    # PASSWORD_HASH_WORKERS is per server process, gunicorn-cfg.py divides the CPUs among its workers.
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(os.cpu_count() or 1, 4)))
+    PASSWORD_HASH_MAX_PENDING = 64
+
+    # Keyset pagination of list endpoints, pages are never larger than LIST_MAX_PAGE_SIZE.
+    # /api/project/listall keeps returning every project unless asked for a page.
+    LIST_PAGE_SIZE = 50
+    LIST_MAX_PAGE_SIZE = 200
+    PROJECT_LIST_PAGINATE_BY_DEFAULT = False
+
+    # Rows fetched per round trip by the streaming NDJSON export
+    EXPORT_BATCH_SIZE = 500
+
+    # Largest number of issues accepted by one bulk request
+    BULK_MAX_ITEMS = 1000
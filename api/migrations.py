@@ -0,0 +1,205 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Schema migrations for existing SQLite databases.
+
+    db.create_all only creates missing tables, so changes to existing tables
+    are applied here. Every step is idempotent, because tables created by
+    db.create_all already have the latest shape. The last applied step is
+    stored in SQLite's user_version pragma. Steps are frozen SQL and must
+    never be edited once released, add a new step instead.
+'''
+
+
+def _columns(cursor, table):
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _add_column(cursor, table, column, ddl):
+    if column not in _columns(cursor, table):
+        cursor.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+
+
+def _hashed_token_blocklist(cursor):
+    # the old table stored raw tokens and was never written to, so it is recreated empty
+    if 'jwt_token' in _columns(cursor, 'jwt_token_blocklist'):
+        cursor.execute('DROP TABLE jwt_token_blocklist')
+    cursor.execute('CREATE TABLE IF NOT EXISTS jwt_token_blocklist ('
+                   'id INTEGER NOT NULL, '
+                   'token_hash VARCHAR(64) NOT NULL, '
+                   'expires_at DATETIME NOT NULL, '
+                   'created_at DATETIME NOT NULL, '
+                   'PRIMARY KEY (id), '
+                   'UNIQUE (token_hash))')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_jwt_token_blocklist_expires_at ON jwt_token_blocklist (expires_at)')
+
+
+def _user_session_version(cursor):
+    _add_column(cursor, 'users', 'session_version', "INTEGER DEFAULT '0' NOT NULL")
+
+
+def _lookup_indexes(cursor):
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_live ON users (email) WHERE deleted = 0')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username_live ON users (username) WHERE deleted = 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_project_creator_name_live ON project (created_by, project_name) WHERE deleted = 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_issue_project_live ON issue (parent_project) WHERE deleted = 0')
+
+
+def _project_keyset_index(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_project_creator_deleted_id ON project (created_by, deleted, id)')
+
+
+def _issue_listing_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_issue_project_status_live ON issue (parent_project, issue_status) '
+                   'WHERE deleted = 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_issue_project_created_live ON issue (parent_project, date_created, id, '
+                   'issue_status, issue_type, created_by, issue_title) WHERE deleted = 0')
+
+
+def _date_updated_columns(cursor):
+    for table in ('project', 'issue'):
+        _add_column(cursor, table, 'date_updated', 'DATETIME')
+        cursor.execute(f'UPDATE "{table}" SET date_updated = date_created WHERE date_updated IS NULL')
+
+
+def _issue_search_index(cursor):
+    # external content table over the titles of live issues, created_by scopes matches to one user
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS issue_fts USING fts5("
+                   "issue_title, created_by, content='issue', content_rowid='id', prefix='2 3')")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_fts_ai AFTER INSERT ON issue WHEN new.deleted = 0 BEGIN "
+                   "INSERT INTO issue_fts(rowid, issue_title, created_by) VALUES (new.id, new.issue_title, new.created_by); "
+                   "END")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_fts_au AFTER UPDATE OF issue_title, created_by, deleted ON issue BEGIN "
+                   "INSERT INTO issue_fts(issue_fts, rowid, issue_title, created_by) "
+                   "SELECT 'delete', old.id, old.issue_title, old.created_by WHERE old.deleted = 0; "
+                   "INSERT INTO issue_fts(rowid, issue_title, created_by) "
+                   "SELECT new.id, new.issue_title, new.created_by WHERE new.deleted = 0; "
+                   "END")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_fts_ad AFTER DELETE ON issue WHEN old.deleted = 0 BEGIN "
+                   "INSERT INTO issue_fts(issue_fts, rowid, issue_title, created_by) "
+                   "VALUES ('delete', old.id, old.issue_title, old.created_by); "
+                   "END")
+    cursor.execute("INSERT INTO issue_fts(issue_fts) VALUES ('delete-all')")
+    cursor.execute("INSERT INTO issue_fts(rowid, issue_title, created_by) "
+                   "SELECT id, issue_title, created_by FROM issue WHERE deleted = 0")
+
+
+def _issue_breakdown(cursor):
+    # counts of live issues per project, status and type, kept current by triggers on issue
+    cursor.execute('CREATE TABLE IF NOT EXISTS issue_breakdown ('
+                   'project_id INTEGER NOT NULL, '
+                   'issue_status VARCHAR(16) NOT NULL, '
+                   'issue_type VARCHAR(16) NOT NULL, '
+                   'issue_count INTEGER NOT NULL, '
+                   'PRIMARY KEY (project_id, issue_status, issue_type), '
+                   'FOREIGN KEY(project_id) REFERENCES project (id))')
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_breakdown_ai AFTER INSERT ON issue WHEN new.deleted = 0 BEGIN "
+                   "INSERT INTO issue_breakdown(project_id, issue_status, issue_type, issue_count) "
+                   "VALUES (new.parent_project, new.issue_status, new.issue_type, 1) "
+                   "ON CONFLICT(project_id, issue_status, issue_type) DO UPDATE SET issue_count = issue_count + 1; "
+                   "END")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_breakdown_au "
+                   "AFTER UPDATE OF issue_status, issue_type, parent_project, deleted ON issue BEGIN "
+                   "UPDATE issue_breakdown SET issue_count = max(issue_count - 1, 0) "
+                   "WHERE old.deleted = 0 AND project_id = old.parent_project "
+                   "AND issue_status = old.issue_status AND issue_type = old.issue_type; "
+                   "INSERT INTO issue_breakdown(project_id, issue_status, issue_type, issue_count) "
+                   "SELECT new.parent_project, new.issue_status, new.issue_type, 1 WHERE new.deleted = 0 "
+                   "ON CONFLICT(project_id, issue_status, issue_type) DO UPDATE SET issue_count = issue_count + 1; "
+                   "END")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS issue_breakdown_ad AFTER DELETE ON issue WHEN old.deleted = 0 BEGIN "
+                   "UPDATE issue_breakdown SET issue_count = max(issue_count - 1, 0) "
+                   "WHERE project_id = old.parent_project "
+                   "AND issue_status = old.issue_status AND issue_type = old.issue_type; "
+                   "END")
+    cursor.execute('DELETE FROM issue_breakdown')
+    cursor.execute('INSERT INTO issue_breakdown(project_id, issue_status, issue_type, issue_count) '
+                   'SELECT parent_project, issue_status, issue_type, count(*) FROM issue WHERE deleted = 0 '
+                   'GROUP BY parent_project, issue_status, issue_type')
+
+
+def _row_versions(cursor):
+    for table in ('project', 'issue'):
+        _add_column(cursor, table, 'version', "INTEGER DEFAULT '1' NOT NULL")
+
+
+def _covering_listing_index(cursor):
+    # list pages select the version for their ETag, and SQLite only treats a partial
+    # index as covering when it also stores the column of its WHERE clause
+    cursor.execute('DROP INDEX IF EXISTS ix_issue_project_created_live')
+    cursor.execute('CREATE INDEX ix_issue_project_created_live ON issue (parent_project, date_created, id, '
+                   'issue_status, issue_type, created_by, issue_title, version, deleted) WHERE deleted = 0')
+
+
+def _blocklist_autoincrement(cursor):
+    # without AUTOINCREMENT SQLite reuses the ids of purged rows, the table is rebuilt to keep them increasing
+    table_sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jwt_token_blocklist'").fetchone()[0]
+    if 'AUTOINCREMENT' in table_sql.upper():
+        return
+    cursor.execute('CREATE TABLE jwt_token_blocklist_new ('
+                   'id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                   'token_hash VARCHAR(64) NOT NULL, '
+                   'expires_at DATETIME NOT NULL, '
+                   'created_at DATETIME NOT NULL, '
+                   'UNIQUE (token_hash))')
+    cursor.execute('INSERT INTO jwt_token_blocklist_new (id, token_hash, expires_at, created_at) '
+                   'SELECT id, token_hash, expires_at, created_at FROM jwt_token_blocklist')
+    cursor.execute('DROP TABLE jwt_token_blocklist')
+    cursor.execute('ALTER TABLE jwt_token_blocklist_new RENAME TO jwt_token_blocklist')
+    cursor.execute('CREATE INDEX ix_jwt_token_blocklist_expires_at ON jwt_token_blocklist (expires_at)')
+
+
+def _covering_id_listing_index(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_issue_project_id_live ON issue (parent_project, id, '
+                   'issue_status, issue_type, created_by, issue_title, date_created, version, deleted) WHERE deleted = 0')
+
+
+MIGRATIONS = [
+    (1, 'hashed token blocklist with expiry', _hashed_token_blocklist),
+    (2, 'users.session_version', _user_session_version),
+    (3, 'indexes for hot lookups, unique live email and username', _lookup_indexes),
+    (4, 'keyset pagination index for projects', _project_keyset_index),
+    (5, 'issue listing indexes', _issue_listing_indexes),
+    (6, 'project.date_updated and issue.date_updated', _date_updated_columns),
+    (7, 'full text search index over issue titles', _issue_search_index),
+    (8, 'per project issue breakdown by status and type', _issue_breakdown),
+    (9, 'project.version and issue.version', _row_versions),
+    (10, 'issue.version and issue.deleted in the covering listing index', _covering_listing_index),
+    (11, 'jwt_token_blocklist ids are never reused', _blocklist_autoincrement),
+    (12, 'covering index for listing issues by id', _covering_id_listing_index),
+]
+
+
+def upgrade(engine):
+    '''
+        Applies pending migrations in one write transaction and returns their descriptions.
+        BEGIN IMMEDIATE makes concurrent upgrades wait for each other, db.create_all before
+        it is not serialized, under gunicorn the master creates the schema before forking.
+    '''
+    raw_connection = engine.raw_connection()
+    sqlite_connection = raw_connection.connection
+    isolation_level = sqlite_connection.isolation_level
+    sqlite_connection.isolation_level = None
+    cursor = sqlite_connection.cursor()
+    applied = []
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for number, description, migrate in MIGRATIONS:
+            if number > version:
+                migrate(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
+                applied.append(description)
+        cursor.execute('COMMIT')
+    except:
+        if sqlite_connection.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+        sqlite_connection.isolation_level = isolation_level
+        raw_connection.close()
+    return applied
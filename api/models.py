@@ -3,23 +3,93 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+from collections import Counter
 from datetime import datetime
 from email.policy import default
+from functools import partial
 
+import hashlib
 import json
 
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .cache import token_cache, session_versions, user_tag
+from .passwords import hash_password, verify_password, needs_rehash
+from .serialization import fragment_cache
 
 db = SQLAlchemy()
 
 
+def token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_user_caches(user_id):
+    token_cache.invalidate_tag(user_tag(user_id))
+    session_versions.delete(user_tag(user_id))
+
+
+'''
+    Unit of work: inside a request save() only flushes, and the request is
+    committed once when it ends (see api/__init__.py). Outside of a request,
+    e.g. in CLI commands, save() commits right away.
+'''
+
+def in_unit_of_work():
+    return has_request_context() and g.get('unit_of_work', False)
+
+def commit_or_defer():
+    if in_unit_of_work():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+def has_pending_writes():
+    return bool(db.session.new or db.session.dirty or db.session.deleted or db.session.info.get('has_writes'))
+
+def on_commit(callback):
+    '''
+        Runs the callback once the current transaction is committed, it is dropped on rollback
+    '''
+    db.session.info.setdefault('on_commit', []).append(callback)
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    session.info['has_writes'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _run_commit_callbacks(session):
+    session.info.pop('has_writes', None)
+    if has_request_context():
+        g.commit_count = g.get('commit_count', 0) + 1
+    for callback in session.info.pop('on_commit', []):
+        callback()
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_commit_callbacks(session):
+    session.info.pop('has_writes', None)
+    session.info.pop('on_commit', None)
+
+
 class Users(db.Model):
+    __table_args__ = (db.Index('ix_users_email_live', 'email', unique=True, sqlite_where=db.text('deleted = 0')),
+                      db.Index('ix_users_username_live', 'username', unique=True, sqlite_where=db.text('deleted = 0')))
+
     id = db.Column(db.Integer(), primary_key=True)
     username = db.Column(db.String(32), nullable=False)
     email = db.Column(db.String(64), nullable=False)
     password = db.Column(db.Text())
+    # no longer read, logout is tracked by session_version
     jwt_auth_active = db.Column(db.Boolean())
+    session_version = db.Column(db.Integer(), default=0, server_default='0', nullable=False)
     date_joined = db.Column(db.DateTime(), default=datetime.utcnow)
     deleted = db.Column(db.Boolean, default=False, nullable=False)
 
@@ -28,13 +98,18 @@ class Users(db.Model):
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        on_commit(partial(invalidate_user_caches, self.id))
+        commit_or_defer()
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password)
 
     def update_email(self, new_email):
         self.email = new_email
@@ -42,11 +117,11 @@ class Users(db.Model):
     def update_username(self, new_username):
         self.username = new_username
 
-    def check_jwt_auth_active(self):
-        return self.jwt_auth_active
-
-    def set_jwt_auth_active(self, set_status):
-        self.jwt_auth_active = set_status
+    def bump_session_version(self):
+        '''
+            Invalidates every token issued to the user so far
+        '''
+        self.session_version = (self.session_version or 0) + 1
     
     def delete_user(self):
         self.deleted = True
@@ -55,6 +130,10 @@ class Users(db.Model):
     def get_by_id(cls, id):
         return cls.query.filter_by(id=id, deleted=False)
 
+    @classmethod
+    def get_session_version(cls, id):
+        return db.session.query(cls.session_version).filter_by(id=id, deleted=False).scalar()
+
     @classmethod
     def get_by_email(cls, email):
         return cls.query.filter_by(email=email, deleted=False).first()
@@ -63,6 +142,25 @@ class Users(db.Model):
     def get_by_username(cls, username):
         return cls.query.filter_by(username=username, deleted=False).first()
 
+    def to_principal(self):
+        '''
+            Snapshot of the columns token_required needs, safe to keep in the token cache
+        '''
+        return {"id": self.id,
+                "username": self.username,
+                "email": self.email,
+                "session_version": self.session_version,
+                "deleted": self.deleted}
+
+    @classmethod
+    def from_principal(cls, principal):
+        '''
+            Rebuilds a session bound user from a cached principal without querying the database
+        '''
+        user = cls(**principal)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
     def toDICT(self):
 
         cls_dict = {}
@@ -77,49 +175,142 @@ class Users(db.Model):
 
 
 class JWTTokenBlocklist(db.Model):
+    # ids are never reused after purges, workers sync their revocation filters by the last seen id
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer(), primary_key=True)
-    jwt_token = db.Column(db.String(), nullable=False)
-    created_at = db.Column(db.DateTime(), nullable=False)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime(), nullable=False, index=True)
+    created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
 
     def __repr__(self):
-        return f'Expired Token: {self.jwt_token}'
+        return f'Revoked Token: {self.token_hash}'
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        commit_or_defer()
+
+    @classmethod
+    def is_revoked(cls, token_hash):
+        return db.session.query(cls.id).filter_by(token_hash=token_hash).scalar() is not None
+
+    @classmethod
+    def purge_expired(cls, batch_size=1000):
+        '''
+            Deletes entries of already expired tokens in batches, returns the number of deleted rows
+        '''
+        now = datetime.utcnow()
+        purged = 0
+        while True:
+            expired_ids = [row.id for row in db.session.query(cls.id).filter(cls.expires_at <= now).limit(batch_size)]
+            if not expired_ids:
+                return purged
+            cls.query.filter(cls.id.in_(expired_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            purged += len(expired_ids)
+
+    @classmethod
+    def count(cls):
+        return db.session.query(db.func.count(cls.id)).scalar()
+
+
+class ListColumnsMixin():
+    '''
+        Models listed in responses name in list_columns the columns read by their
+        serialize() and the version for ETags
+    '''
+    list_columns = ()
+
+    @classmethod
+    def with_list_columns(cls, query, *extra):
+        '''
+            The query selecting only the serialized columns and version as row tuples,
+            lists built from them skip creating and tracking ORM instances
+        '''
+        return query.with_entities(*[getattr(cls, name) for name in cls.list_columns + extra])
+
+    @classmethod
+    def fragment(cls, row):
+        '''
+            Encoded JSON of serialize(row) from the fragment cache, row needs the version column
+        '''
+        return fragment_cache.get(cls.__tablename__, row.id, row.version, partial(cls.serialize, row))
+
+
+class Project(ListColumnsMixin, db.Model):
+    __table_args__ = (db.Index('ix_project_creator_name_live', 'created_by', 'project_name', sqlite_where=db.text('deleted = 0')),
+                      db.Index('ix_project_creator_deleted_id', 'created_by', 'deleted', 'id'))
 
-class Project(db.Model):
     id = db.Column(db.Integer(), primary_key=True)
     project_name = db.Column(db.String(32), nullable=False)
     number_of_issues = db.Column(db.Integer(), default=0, nullable=False)
     created_by = db.Column(db.Integer(), db.ForeignKey(Users.id), nullable=False)
     date_created = db.Column(db.DateTime(), default=datetime.utcnow)
+    date_updated = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted = db.Column(db.Boolean, default=False, nullable=False)
+    # bumped by every ORM flush, which fails with StaleDataError if the row changed since it was loaded
+    version = db.Column(db.Integer(), default=1, server_default='1', nullable=False)
 
+    __mapper_args__ = {"version_id_col": version}
+
+    list_columns = ('id', 'project_name', 'number_of_issues', 'version')
 
     def __repr__(self):
         return f'Project {self.project_name}'
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        commit_or_defer()
 
     def set_project_name(self, project_name):
         self.project_name = project_name
 
-    def increment_issue_count(self):
-        self.number_of_issues += 1
-    
-    def decrement_issue_count(self):
-        if self.number_of_issues > 0:
-            self.number_of_issues -= 1
-        
     def update_username(self, new_username):
         self.username = new_username
 
     def delete_project(self):
         self.deleted = True
+        self.number_of_issues = 0
             
+    @classmethod
+    def adjust_issue_count(cls, project_id, delta):
+        '''
+            Changes the issue counter with a single UPDATE, committed together with the issue change
+        '''
+        cls.query.filter_by(id=project_id) \
+                 .update({cls.number_of_issues: db.func.max(cls.number_of_issues + delta, 0),
+                          cls.version: cls.version + 1},
+                         synchronize_session=False)
+
+    @classmethod
+    def reconcile_issue_counts(cls):
+        '''
+            Recomputes issue counters from live issues, returns the number of corrected projects
+        '''
+        live_counts = dict(db.session.query(Issue.parent_project, db.func.count(Issue.id))
+                                     .filter_by(deleted=False)
+                                     .group_by(Issue.parent_project))
+        drifted = [{"project_id": project_id, "count": live_counts.get(project_id, 0)}
+                   for project_id, number_of_issues in db.session.query(cls.id, cls.number_of_issues)
+                   if live_counts.get(project_id, 0) != number_of_issues]
+        if drifted:
+            db.session.execute(db.update(cls.__table__)
+                                 .where(cls.__table__.c.id == db.bindparam("project_id"))
+                                 .values(number_of_issues=db.bindparam("count"),
+                                         version=cls.__table__.c.version + 1),
+                               drifted)
+            db.session.commit()
+        return len(drifted)
+
+    @classmethod
+    def get_ids_by_creator(cls, project_ids, creator_id):
+        '''
+            The subset of project_ids that the creator has access to
+        '''
+        return {row.id for row in db.session.query(cls.id).filter(cls.id.in_(project_ids),
+                                                                  cls.created_by == creator_id,
+                                                                  cls.deleted == False)}
+
     @classmethod
     def get_by_id(cls, project_id, creator_id):
         return cls.query.filter_by(id = project_id, created_by=creator_id, deleted=False).first()
@@ -132,19 +323,51 @@ class Project(db.Model):
     def get_by_cerator(cls, creator_id):
         return cls.query.filter_by(created_by=creator_id, deleted=False)
 
-    def toDICT(self):
+    @classmethod
+    def get_for_export(cls, creator_id, since=None):
+        '''
+            Projects of a creator in id order, with since also the deleted ones changed after it
+        '''
+        if since is None:
+            return cls.get_by_cerator(creator_id).order_by(cls.id)
+        return cls.query.filter(cls.created_by == creator_id, cls.date_updated >= since).order_by(cls.id)
 
+    @classmethod
+    def get_page_by_creator(cls, creator_id, after_id, limit):
+        '''
+            Projects of a creator with an id greater than after_id, in id order
+        '''
+        return cls.get_by_cerator(creator_id).filter(cls.id > after_id).order_by(cls.id).limit(limit)
+
+    @staticmethod
+    def serialize(row):
+        '''
+            Response dict of a project instance or of a row of with_list_columns
+        '''
         cls_dict = {}
-        cls_dict['_id'] = self.id
-        cls_dict['project_name'] = self.project_name
-        cls_dict['number_of_issues'] = self.number_of_issues
+        cls_dict['_id'] = row.id
+        cls_dict['project_name'] = row.project_name
+        cls_dict['number_of_issues'] = row.number_of_issues
 
         return cls_dict
 
+    def toDICT(self):
+        return self.serialize(self)
+
     def toJSON(self):
         return self.toDICT()
 
-class Issue(db.Model):
+class Issue(ListColumnsMixin, db.Model):
+    __table_args__ = (db.Index('ix_issue_project_live', 'parent_project', sqlite_where=db.text('deleted = 0')),
+                      db.Index('ix_issue_project_status_live', 'parent_project', 'issue_status', sqlite_where=db.text('deleted = 0')),
+                      # cover listing by creation date and by id, filters are evaluated without reading the table
+                      db.Index('ix_issue_project_created_live', 'parent_project', 'date_created', 'id', 'issue_status',
+                               'issue_type', 'created_by', 'issue_title', 'version', 'deleted',
+                               sqlite_where=db.text('deleted = 0')),
+                      db.Index('ix_issue_project_id_live', 'parent_project', 'id', 'issue_status', 'issue_type',
+                               'created_by', 'issue_title', 'date_created', 'version', 'deleted',
+                               sqlite_where=db.text('deleted = 0')))
+
     id = db.Column(db.Integer(), primary_key=True)
     issue_title = db.Column(db.String(32), nullable=False)
     issue_type = db.Column(db.String(16), nullable=False)
@@ -152,14 +375,21 @@ class Issue(db.Model):
     parent_project = db.Column(db.Integer(), db.ForeignKey(Project.id), nullable=False)
     created_by = db.Column(db.Integer(), db.ForeignKey(Users.id), nullable=False)
     date_created = db.Column(db.DateTime(), default=datetime.utcnow)
+    date_updated = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted = db.Column(db.Boolean, default=False, nullable=False)
+    # bumped by every ORM flush, which fails with StaleDataError if the row changed since it was loaded
+    version = db.Column(db.Integer(), default=1, server_default='1', nullable=False)
+
+    __mapper_args__ = {"version_id_col": version}
+
+    list_columns = ('id', 'issue_title', 'issue_type', 'issue_status', 'parent_project', 'created_by', 'version')
 
     def __repr__(self):
         return f'Issue {self.issue_title}'
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        commit_or_defer()
 
     def set_issue_title(self, issue_title):
         self.issue_title = issue_title
@@ -184,18 +414,207 @@ class Issue(db.Model):
     def get_issues_by_project_id(cls, project_id):
         return cls.query.filter_by(parent_project=project_id, deleted=False)
 
-    def toDICT(self):
+    @classmethod
+    def get_page_by_project(cls, project_id, limit, sort='id', after=None, issue_status=None, issue_type=None,
+                            created_by=None, created_after=None, created_before=None):
+        '''
+            Filtered page of live issues of a project. The order is stable since ties are broken
+            by id, and after holds the sort key values of the last issue of the previous page.
+        '''
+        query = cls.get_issues_by_project_id(project_id)
+        if issue_status:
+            query = query.filter_by(issue_status=issue_status)
+        if issue_type:
+            query = query.filter_by(issue_type=issue_type)
+        if created_by:
+            query = query.filter_by(created_by=created_by)
+        if created_after:
+            query = query.filter(cls.date_created >= created_after)
+        if created_before:
+            query = query.filter(cls.date_created < created_before)
+
+        descending = sort.startswith('-')
+        sort_keys = cls.sort_keys(sort)
+        if after is not None:
+            row = db.tuple_(*sort_keys)
+            last = db.tuple_(*[db.literal(value, key.type) for key, value in zip(sort_keys, after)])
+            query = query.filter(row < last if descending else row > last)
+
+        return query.order_by(*[key.desc() if descending else key for key in sort_keys]).limit(limit)
+
+    @classmethod
+    def sort_keys(cls, sort):
+        column = getattr(cls, sort.lstrip('-'))
+        return (cls.id,) if column is cls.id else (column, cls.id)
+
+    @classmethod
+    def get_for_export(cls, creator_id, since=None):
+        '''
+            Issues in projects of a creator in id order, with since also the deleted ones changed after it
+        '''
+        query = cls.query.join(Project, Project.id == cls.parent_project).filter(Project.created_by == creator_id)
+        if since is None:
+            query = query.filter(cls.deleted == False, Project.deleted == False)
+        else:
+            query = query.filter(cls.date_updated >= since)
+        return query.order_by(cls.id)
+
+    @classmethod
+    def create_many(cls, rows):
+        '''
+            Inserts issues with one executemany INSERT, bumps the counter of each parent project
+            once and returns the new ids in the order of rows. The counter UPDATEs run first and
+            take SQLite's write lock, so the rowids of the INSERT are consecutive after the
+            current max id.
+        '''
+        for project_id, count in Counter(row["parent_project"] for row in rows).items():
+            Project.adjust_issue_count(project_id, count)
+        first_id = (db.session.query(db.func.max(cls.id)).scalar() or 0) + 1
+        db.session.execute(db.insert(cls), rows)
+        return list(range(first_id, first_id + len(rows)))
+
+    @classmethod
+    def select_accessible(cls, creator_id, issue_ids=None, project_id=None, issue_status=None, issue_type=None):
+        '''
+            Select of id and parent project of the live issues in live projects of the creator,
+            restricted to issue_ids and/or a project, status and type filter
+        '''
+        query = db.select(cls.id, cls.parent_project) \
+                  .join(Project, Project.id == cls.parent_project) \
+                  .where(Project.created_by == creator_id, Project.deleted == False, cls.deleted == False)
+        if issue_ids is not None:
+            query = query.where(cls.id.in_(issue_ids))
+        if project_id is not None:
+            query = query.where(cls.parent_project == project_id)
+        if issue_status:
+            query = query.where(cls.issue_status == issue_status)
+        if issue_type:
+            query = query.where(cls.issue_type == issue_type)
+        return query
+
+    @classmethod
+    def count_by_project(cls, selection):
+        '''
+            Number of selected issues per parent project
+        '''
+        grouped = selection.with_only_columns(cls.parent_project, db.func.count(cls.id)).group_by(cls.parent_project)
+        return dict(db.session.execute(grouped).all())
+
+    @classmethod
+    def update_many(cls, selection, values):
+        '''
+            Applies the same changes to every selected issue with one UPDATE
+        '''
+        return cls.query.filter(cls.id.in_(selection.with_only_columns(cls.id))) \
+                        .update({**values, cls.version: cls.version + 1}, synchronize_session=False)
+
+    @classmethod
+    def search(cls, creator_id, terms, limit, offset=0, project_id=None):
+        '''
+            List column rows of the live issues of the creator's projects whose title matches
+            every term as a prefix, best bm25 rank first. Issues are only ever created by the owner of their project,
+            so matching created_by inside the index scopes the search before ranking.
+        '''
+        match = 'created_by : "%d" AND issue_title : (%s)' % (
+            creator_id, ' AND '.join('"%s"*' % term.replace('"', '""') for term in terms))
+        statement = db.text('SELECT ' + ', '.join('issue.' + name for name in cls.list_columns) + ' FROM issue_fts '
+                            'JOIN issue ON issue.id = issue_fts.rowid '
+                            'JOIN project ON project.id = issue.parent_project '
+                            'WHERE issue_fts MATCH :match AND project.created_by = :creator_id '
+                            'AND project.deleted = 0 AND issue.deleted = 0 '
+                            + ('AND issue.parent_project = :project_id ' if project_id is not None else '') +
+                            'ORDER BY issue_fts.rank, issue.id LIMIT :limit OFFSET :offset')
+        return db.session.execute(statement, {"match": match, "creator_id": creator_id, "project_id": project_id,
+                                              "limit": limit, "offset": offset}).all()
+
+    @classmethod
+    def rebuild_search_index(cls):
+        '''
+            Reindexes the titles of all live issues, returns the number of indexed issues
+        '''
+        db.session.execute(db.text("INSERT INTO issue_fts(issue_fts) VALUES ('delete-all')"))
+        indexed = db.session.execute(db.text("INSERT INTO issue_fts(rowid, issue_title, created_by) "
+                                             "SELECT id, issue_title, created_by FROM issue WHERE deleted = 0")).rowcount
+        db.session.commit()
+        return indexed
 
+    @classmethod
+    def delete_issues_of_project(cls, project_id):
+        '''
+            Soft deletes every live issue of a project with one UPDATE, returns the number of deleted issues
+        '''
+        return cls.query.filter_by(parent_project=project_id, deleted=False) \
+                        .update({cls.deleted: True, cls.version: cls.version + 1}, synchronize_session=False)
+
+    @staticmethod
+    def serialize(row):
+        '''
+            Response dict of an issue instance or of a row of with_list_columns
+        '''
         cls_dict = {}
-        cls_dict['_id'] = self.id
-        cls_dict['issue_title'] = self.issue_title
-        cls_dict['issue_type'] = self.issue_type
-        cls_dict['issue_status'] = self.issue_status
-        cls_dict['parent_project'] = self.parent_project
-        cls_dict['created_by'] = self.created_by
+        cls_dict['_id'] = row.id
+        cls_dict['issue_title'] = row.issue_title
+        cls_dict['issue_type'] = row.issue_type
+        cls_dict['issue_status'] = row.issue_status
+        cls_dict['parent_project'] = row.parent_project
+        cls_dict['created_by'] = row.created_by
 
         return cls_dict
 
+    def toDICT(self):
+        return self.serialize(self)
+
     def toJSON(self):
 
-        return self.toDICT()
\ No newline at end of file
+        return self.toDICT()
+
+
+class IssueBreakdown(db.Model):
+    '''
+        Number of live issues per project, status and type. The rows are maintained by
+        SQLite triggers on the issue table (see migrations), so every write path,
+        including bulk and set-based updates, keeps them in the same transaction.
+    '''
+    project_id = db.Column(db.Integer(), db.ForeignKey(Project.id), primary_key=True)
+    issue_status = db.Column(db.String(16), primary_key=True)
+    issue_type = db.Column(db.String(16), primary_key=True)
+    issue_count = db.Column(db.Integer(), default=0, nullable=False)
+
+    def __repr__(self):
+        return f"Breakdown {self.project_id} {self.issue_status} {self.issue_type}: {self.issue_count}"
+
+    @classmethod
+    def get_by_creator(cls, creator_id, project_id=None):
+        '''
+            Live projects of a creator joined with their non-empty breakdown rows, in project id order
+        '''
+        query = db.session.query(Project.id, Project.project_name, Project.number_of_issues,
+                                 cls.issue_status, cls.issue_type, cls.issue_count) \
+                          .outerjoin(cls, db.and_(cls.project_id == Project.id, cls.issue_count > 0)) \
+                          .filter(Project.created_by == creator_id, Project.deleted == False)
+        if project_id is not None:
+            query = query.filter(Project.id == project_id)
+        return query.order_by(Project.id)
+
+    @classmethod
+    def reconcile(cls):
+        '''
+            Recomputes the breakdown from live issues, returns the number of corrected rows
+        '''
+        live_counts = {(row[0], row[1], row[2]): row[3] for row in
+                       db.session.query(Issue.parent_project, Issue.issue_status, Issue.issue_type,
+                                        db.func.count(Issue.id))
+                                 .filter_by(deleted=False)
+                                 .group_by(Issue.parent_project, Issue.issue_status, Issue.issue_type)}
+        stored_counts = {(row.project_id, row.issue_status, row.issue_type): row.issue_count
+                         for row in db.session.query(cls)}
+        drifted = [key for key in live_counts.keys() | stored_counts.keys()
+                   if live_counts.get(key, 0) != stored_counts.get(key, 0)]
+        if drifted:
+            db.session.execute(db.delete(cls.__table__))
+            if live_counts:
+                db.session.execute(db.insert(cls.__table__),
+                                   [{"project_id": key[0], "issue_status": key[1], "issue_type": key[2], "issue_count": count}
+                                    for key, count in live_counts.items()])
+            db.session.commit()
+        return len(drifted)
@@ -0,0 +1,39 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import base64
+import binascii
+import json
+
+'''
+    Keyset pagination helpers. A cursor is an opaque, url safe encoding of
+    the sort key values of the last row of a page.
+'''
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, dict):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def page_size(requested, default, maximum):
+    if not requested:
+        return default
+    return max(1, min(requested, maximum))
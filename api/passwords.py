@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from .config import BaseConfig
+
+'''
+    Password hashing is CPU bound and holds the GIL, so it is run in a
+    dedicated process pool. The calling thread only waits on the result,
+    leaving the interpreter free for other requests of the same worker.
+    Hashing processes are started by a forkserver, forking the threaded
+    worker itself could copy locks held by its other threads.
+'''
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending_slots = threading.BoundedSemaphore(max(BaseConfig.PASSWORD_HASH_MAX_PENDING, 1))
+
+
+def _get_executor():
+    global _executor, _executor_pid
+
+    if BaseConfig.PASSWORD_HASH_WORKERS <= 0:
+        return None
+
+    with _executor_lock:
+        # a pool inherited through fork belongs to the parent process
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=BaseConfig.PASSWORD_HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+
+    with _executor_lock:
+        _executor = None
+
+
+def _run(func, *args, **kwargs):
+    executor = _get_executor()
+    if executor is None:
+        return func(*args, **kwargs)
+
+    with _pending_slots:
+        try:
+            return executor.submit(func, *args, **kwargs).result()
+        except BrokenProcessPool:
+            _reset_executor()
+            return func(*args, **kwargs)
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password,
+                method=BaseConfig.PASSWORD_HASH_METHOD,
+                salt_length=BaseConfig.PASSWORD_SALT_LENGTH)
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    '''
+        True when the stored hash was made with other parameters than the configured ones
+    '''
+    return pwhash.split('$', 1)[0] != BaseConfig.PASSWORD_HASH_METHOD
@@ -5,20 +5,69 @@ Copyright (c) 2019 - present AppSeed.us
 
 from datetime import datetime, timezone, timedelta
 
-from functools import wraps
+from functools import partial, wraps
+import hashlib
+import re
+import time
+import uuid
 
-from flask import request
-from flask_restx import Api, Resource, fields
+from flask import Response, request, stream_with_context
+from flask_restx import Api, Resource, fields, inputs
 
 import jwt
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.http import quote_etag
 
-from .models import db, Users, JWTTokenBlocklist, Project, Issue
+from .models import db, Users, JWTTokenBlocklist, Project, Issue, IssueBreakdown, token_digest, on_commit
 from .config import BaseConfig
+from .cache import token_cache, session_versions, read_cache, user_tag, project_tag, project_list_tag, issue_tag, project_issues_tag
+from .bloom import revocation_filter
+from .pagination import InvalidCursor, encode_cursor, decode_cursor, page_size
+from .compression import strip_encoding_suffix
+from .serialization import dumps, output_json, fragment_cache, json_array, list_response
 
 rest_api = Api(version='1.0', title='Gira API')
+rest_api.representation('application/json')(output_json)
 users_api = rest_api.namespace('Users Endpoints', path='/api/users', description='Api endpoints for user related operations')
 project_api = rest_api.namespace('Project Endpoints', path='/api/project', description='Api endpoints for project related operations')
 issue_api = rest_api.namespace('Issue Endpoints', path='/api/issue', description='Api endpoints for issue related operations')
+metrics_api = rest_api.namespace('Metrics Endpoints', path='/api/metrics', description='Api endpoints for runtime metrics of the server')
+
+
+'''
+    Integers taken from requests must fit an SQLite INTEGER before they are bound to a query
+'''
+
+SQLITE_INTEGER_MIN = -2 ** 63
+SQLITE_INTEGER_MAX = 2 ** 63 - 1
+
+def sqlite_integer(value):
+    '''
+        int() of a request value, ValueError when it does not fit an SQLite INTEGER.
+        As the type of a parser argument it makes out of range values a 400.
+    '''
+    number = int(value)
+    if not SQLITE_INTEGER_MIN <= number <= SQLITE_INTEGER_MAX:
+        raise ValueError(f'{value} is out of range')
+    return number
+
+def parse_id(value):
+    '''
+        Id written as ASCII digits, None when it is not one or does not fit an SQLite INTEGER
+    '''
+    if not (value.isascii() and value.isdigit()):
+        return None
+    number = int(value)
+    return number if number <= SQLITE_INTEGER_MAX else None
+
+def utc_naive(value):
+    '''
+        A parsed request datetime as naive UTC, the way date columns are stored
+    '''
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 
 '''
@@ -54,6 +103,17 @@ project_edit_model = project_api.model('ProjectEditModel', {"projectID": fields.
 
 project_delete_model = project_api.model('ProjectDeleteModel', {"projectID": fields.String(required=True, min_length=1, max_length=32)})
 
+project_list_parser = project_api.parser()
+project_list_parser.add_argument('limit', type=int, location='args', help='Page size, capped by the server')
+project_list_parser.add_argument('cursor', type=str, location='args', help='next_cursor of the previous page')
+
+project_stats_parser = project_api.parser()
+project_stats_parser.add_argument('projectID', type=sqlite_integer, location='args', help='Only this project, all projects when omitted')
+
+project_export_parser = project_api.parser()
+project_export_parser.add_argument('since', type=inputs.datetime_from_iso8601, location='args',
+                                   help='Only rows changed since this time, deleted rows are included as tombstones')
+
 '''
     Flask-Restx Issue models for api request and response data
 '''
@@ -63,6 +123,9 @@ issue_create_model = issue_api.model('IssueCreateModel', {"issue_title": fields.
                                                           "parent_project": fields.String(required=True, min_length=1, max_length=32)
                                                          })
 
+issue_bulk_create_model = issue_api.model('IssueBulkCreateModel', {"issues": fields.List(fields.Nested(issue_create_model), required=True,
+                                                                                 min_items=1, max_items=BaseConfig.BULK_MAX_ITEMS)})
+
 issue_view_model = issue_api.model('IssueViewModel', {"issueID": fields.String(required=True, min_length=1, max_length=32)})
 
 issue_edit_model = issue_api.model('IssueEditModel', {"issueID": fields.String(required=True, min_length=1, max_length=32),
@@ -72,12 +135,54 @@ issue_edit_model = issue_api.model('IssueEditModel', {"issueID": fields.String(r
                                                       "parent_project": fields.String(required=False, min_length=1, max_length=32)
                                                       })
 
+issue_search_parser = issue_api.parser()
+issue_search_parser.add_argument('q', type=str, required=True, location='args', help='Words the issue title starts with')
+issue_search_parser.add_argument('projectID', type=sqlite_integer, location='args')
+issue_search_parser.add_argument('page', type=int, default=1, location='args')
+issue_search_parser.add_argument('limit', type=int, location='args', help='Page size, capped by the server')
+
+issue_bulk_filter_model = issue_api.model('IssueBulkFilterModel', {"projectID": fields.String(required=True, min_length=1, max_length=32),
+                                                                   "issue_status": fields.String(required=False, enum=('To Do', 'In Progress', 'Done')),
+                                                                   "issue_type": fields.String(required=False, enum=('Bug', 'Improvement', 'Feature'))
+                                                                   })
+
+issue_bulk_edit_model = issue_api.model('IssueBulkEditModel', {"issueIDs": fields.List(fields.String(min_length=1, max_length=32), required=False,
+                                                                                      max_items=BaseConfig.BULK_MAX_ITEMS),
+                                                               "filter": fields.Nested(issue_bulk_filter_model, required=False),
+                                                               "issue_title": fields.String(required=False, min_length=1, max_length=32),
+                                                               "issue_type": fields.String(required=False, enum=('Bug', 'Improvement', 'Feature')),
+                                                               "issue_status": fields.String(required=False, enum=('To Do', 'In Progress', 'Done')),
+                                                               "parent_project": fields.String(required=False, min_length=1, max_length=32)
+                                                               })
+
 issue_delete_model = issue_api.model('IssueDeleteModel', {"issueID": fields.String(required=True, min_length=1, max_length=32)})
 
+issue_list_parser = issue_api.parser()
+issue_list_parser.add_argument('projectID', type=sqlite_integer, required=True, location='args')
+issue_list_parser.add_argument('issue_status', choices=('To Do', 'In Progress', 'Done'), location='args')
+issue_list_parser.add_argument('issue_type', choices=('Bug', 'Improvement', 'Feature'), location='args')
+issue_list_parser.add_argument('created_by', type=sqlite_integer, location='args')
+issue_list_parser.add_argument('created_after', type=inputs.datetime_from_iso8601, location='args')
+issue_list_parser.add_argument('created_before', type=inputs.datetime_from_iso8601, location='args')
+issue_list_parser.add_argument('sort', choices=('id', '-id', 'date_created', '-date_created'), default='id', location='args')
+issue_list_parser.add_argument('limit', type=int, location='args', help='Page size, capped by the server')
+issue_list_parser.add_argument('cursor', type=str, location='args', help='next_cursor of the previous page')
+
 '''
    Helper function for JWT token required
 '''
 
+def current_session_version(user_id):
+    '''
+        Session version of a user, read from the cached map and loaded on a miss
+    '''
+    session_version = session_versions.get(user_tag(user_id))
+    if session_version is None:
+        session_version = Users.get_session_version(user_id)
+        if session_version is not None:
+            session_versions.set(user_tag(user_id), session_version)
+    return session_version
+
 def token_required(f):
 
     @wraps(f)
@@ -91,6 +196,23 @@ def token_required(f):
         if not token:
             return {"success": False, "msg": "Valid JWT token is missing"}, 400
 
+        digest = token_digest(token)
+
+        # the blocklist table is only queried when the filter reports a possible match
+        if revocation_filter.might_be_revoked(digest):
+            if JWTTokenBlocklist.is_revoked(digest):
+                token_cache.delete(digest)
+                return {"success": False, "msg": "Token revoked."}, 400
+            revocation_filter.record_false_positive()
+
+        principal = token_cache.get(digest)
+
+        if principal is not None:
+            if principal["session_version"] != current_session_version(principal["id"]):
+                token_cache.delete(digest)
+                return {"success": False, "msg": "Token expired."}, 400
+            return f(Users.from_principal(principal), *args, **kwargs)
+
         try:
             data = jwt.decode(token, BaseConfig.SECRET_KEY, algorithms=["HS256"])
             current_user = Users.get_by_email(data["email"])
@@ -99,22 +221,119 @@ def token_required(f):
                 return {"success": False,
                         "msg": "Sorry. Wrong auth token. This user does not exist."}, 400
 
-            token_expired = db.session.query(JWTTokenBlocklist.id).filter_by(jwt_token=token).scalar()
-
-            if token_expired is not None:
-                return {"success": False, "msg": "Token revoked."}, 400
-
-            if not current_user.check_jwt_auth_active():
+            if data.get("sv") != current_user.session_version:
                 return {"success": False, "msg": "Token expired."}, 400
 
         except:
             return {"success": False, "msg": "Token is invalid"}, 400
 
+        session_versions.set(user_tag(current_user.id), current_user.session_version)
+
+        # cached entries must never outlive the token itself
+        token_cache.set(digest, current_user.to_principal(),
+                        ttl=data.get("exp", time.time() + BaseConfig.TOKEN_CACHE_TTL) - time.time(),
+                        tags=(user_tag(current_user.id),))
+
         return f(current_user, *args, **kwargs)
 
     return decorator
 
 
+'''
+   Helper functions for conditional requests, ETags are derived from row versions
+   so a 304 is answered without serializing the body
+'''
+
+def resource_etag(kind, row):
+    return f'{kind}-{row.id}-v{row.version}'
+
+def list_etag(kind, rows, *extra):
+    versions = [(row.id, row.version) for row in rows]
+    return f'{kind}-list-' + hashlib.sha1(repr((versions, extra)).encode()).hexdigest()
+
+def request_etags(header_etags, include_weak=False):
+    '''
+        ETags of a conditional header without the suffix of a compressed representation
+    '''
+    return {strip_encoding_suffix(etag) for etag in header_etags.as_set(include_weak=include_weak)}
+
+def not_modified(etag):
+    '''
+        True if the client already holds the representation, If-None-Match uses the weak comparison
+    '''
+    if_none_match = request.if_none_match
+    return if_none_match.star_tag or etag in request_etags(if_none_match, include_weak=True)
+
+def not_modified_response(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def precondition_failed(etag):
+    '''
+        True if If-Match was sent and none of its ETags is the current one
+    '''
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return False
+    return etag not in request_etags(if_match)
+
+
+'''
+   Helper functions for the read cache. Entries hold the serialized resource and its
+   ETag, they are tagged with the rows they were built from and write handlers drop
+   those tags once their transaction commits.
+'''
+
+def cached_read(key, load):
+    '''
+        The cached entry of key, otherwise load() is called and its (entry, tags) result cached
+    '''
+    entry = read_cache.get(key)
+    if entry is None:
+        loaded = load()
+        if loaded is None:
+            return None
+        entry, tags = loaded
+        read_cache.set(key, entry, tags=tags)
+    return entry
+
+def invalidate_reads(*tags):
+    for tag in tags:
+        on_commit(partial(read_cache.invalidate_tag, tag))
+
+def load_project_list(user_id):
+    project_list = Project.with_list_columns(Project.get_by_cerator(user_id)).all()
+    # the encoded array is kept as text, entries of a shared cache backend must be JSON
+    entry = {"etag": list_etag('project', project_list, None),
+             "count": len(project_list),
+             "projects": json_array([Project.fragment(proj) for proj in project_list]).decode()}
+    return entry, [project_list_tag(user_id)] + [project_tag(proj.id) for proj in project_list]
+
+def load_project(user_id, project_id):
+    project = Project.get_by_id(project_id, user_id)
+    if project is None:
+        return None
+    return {"etag": resource_etag('project', project), "project": project.toJSON()}, (project_tag(project.id),)
+
+def load_issue(user_id, issue_id):
+    issue = Issue.get_by_id(issue_id)
+    if issue is None or Project.get_by_id(issue.parent_project, user_id) is None:
+        return None
+    return ({"etag": resource_etag('issue', issue), "issue": issue.toJSON()},
+            (issue_tag(issue.id), project_issues_tag(issue.parent_project)))
+
+@rest_api.errorhandler(StaleDataError)
+def handle_stale_data(error):
+    '''
+        The row was changed by a concurrent request between loading and flushing it.
+        Flask-RESTX replies with error.data as is, so the SQL error text is not appended.
+    '''
+    error.data = {"success": False,
+                  "msg": "Resource was modified by another request"}
+    return {}, 412
+
+
 '''
     Flask-Restx Users API routes
 '''
@@ -134,22 +353,31 @@ class Register(Resource):
         _email = req_data.get('email')
         _password = req_data.get('password')
 
-        email_exists = Users.get_by_email(_email)
-        username_exists = Users.get_by_username(_username)
-        if email_exists:
+        # cheap index lookups spare duplicate signups the password hash, the partial
+        # unique indexes still decide when two signups for the same identity race
+        if Users.get_by_email(_email):
             return {"success": False,
                     "msg": "Email already taken"}, 400
-        elif username_exists:
+        if Users.get_by_username(_username):
             return {"success": False,
                     "msg": "Username already taken"}, 400
-        else:
-            new_user = Users(username=_username, email=_email)
 
-            new_user.set_password(_password)
+        new_user = Users(username=_username, email=_email)
+        new_user.set_password(_password)
+
+        try:
             new_user.save()
-            return {"success": True,
-                    "userID": new_user.id,
-                    "msg": "The user was successfully registered"}, 200
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'users.email' in str(e.orig):
+                return {"success": False,
+                        "msg": "Email already taken"}, 400
+            return {"success": False,
+                    "msg": "Username already taken"}, 400
+
+        return {"success": True,
+                "userID": new_user.id,
+                "msg": "The user was successfully registered"}, 200
 
 @users_api.route('/login')
 class Login(Resource):
@@ -175,11 +403,15 @@ class Login(Resource):
             return {"success": False,
                     "msg": "Wrong credentials."}, 400
 
-        # create access token uwing JWT
-        token = jwt.encode({"email": _email, "exp": datetime.utcnow() + timedelta(minutes=30)}, BaseConfig.SECRET_KEY)
+        if user.password_needs_rehash():
+            user.set_password(_password)
+            user.save()
 
-        user.set_jwt_auth_active(True)
-        user.save()
+        # create access token uwing JWT, sv ties it to the current session version of the user
+        # jti keeps tokens issued within the same second distinct, so revoking one never revokes another
+        token = jwt.encode({"email": _email, "exp": datetime.utcnow() + timedelta(minutes=30),
+                            "sv": user.session_version, "jti": uuid.uuid4().hex},
+                           BaseConfig.SECRET_KEY)
 
         return {"success": True,
                 "token": token,
@@ -223,9 +455,19 @@ class EditUser(Resource):
 
             if _new_password:
                 self.set_password(_new_password)
+                self.bump_session_version()
                 success_msg = success_msg + 'password '
 
-            self.save()
+            # a concurrent edit or signup can take the name after the checks above
+            try:
+                self.save()
+            except IntegrityError as e:
+                db.session.rollback()
+                if 'users.email' in str(e.orig):
+                    return {"success": False,
+                            "msg": "Email already taken"}, 400
+                return {"success": False,
+                        "msg": "Username already taken"}, 400
         else:
             success_msg = 'Nothing to update' 
 
@@ -242,7 +484,13 @@ class LogoutUser(Resource):
     @token_required
     def post(self, current_user):
 
-        self.set_jwt_auth_active(False)
+        _token = request.headers["authorization"]
+        _token_exp = jwt.decode(_token, BaseConfig.SECRET_KEY, algorithms=["HS256"])["exp"]
+
+        db.session.add(JWTTokenBlocklist(token_hash=token_digest(_token),
+                                         expires_at=datetime.utcfromtimestamp(_token_exp)))
+        self.bump_session_version()
+        on_commit(partial(revocation_filter.add, token_digest(_token)))
         self.save()
 
         return {"success": True,
@@ -274,6 +522,7 @@ class CreateProject(Resource):
         else:
             new_project = Project(project_name = _project_name, created_by=self.id)
             new_project.save()
+            invalidate_reads(project_list_tag(self.id))
 
             return {"success": True,
                     "projectID": new_project.id,
@@ -287,19 +536,48 @@ class ListAllProjects(Resource):
         Lists all projects that a user created
     '''
 
+    @project_api.expect(project_list_parser)
     @token_required
     def get(self, current_user):
-        project_list = Project.get_by_cerator(self.id)
-        projects_to_return = []
-        for proj in project_list:
-            projects_to_return.append(proj.toJSON())
-        if len(projects_to_return) == 0:
-            return {"success": True,
-                "projects": [],
-                "msg": "There are no projects to return"}, 200
-        return {"success": True,
-                "projects": projects_to_return,
-                "msg": "Projects of the current user successfully listed"}, 200
+
+        req_args = project_list_parser.parse_args()
+
+        _limit = req_args.get('limit')
+        _cursor = req_args.get('cursor')
+
+        if _limit is None and _cursor is None and not BaseConfig.PROJECT_LIST_PAGINATE_BY_DEFAULT:
+            cached = cached_read(f'projects:{self.id}', partial(load_project_list, self.id))
+            etag = cached["etag"]
+            if not_modified(etag):
+                return not_modified_response(etag)
+            project_count, projects_to_return = cached["count"], cached["projects"].encode()
+            next_cursor = None
+        else:
+            try:
+                _after_id = sqlite_integer(decode_cursor(_cursor)["id"]) if _cursor else 0
+            except (InvalidCursor, KeyError, TypeError, ValueError):
+                return {"success": False,
+                        "msg": "Invalid pagination cursor"}, 400
+            _page_size = page_size(_limit, BaseConfig.LIST_PAGE_SIZE, BaseConfig.LIST_MAX_PAGE_SIZE)
+            # one extra row tells whether there is a next page
+            project_list = Project.with_list_columns(Project.get_page_by_creator(self.id, _after_id, _page_size + 1)).all()
+            next_cursor = encode_cursor({"id": project_list[_page_size - 1].id}) if len(project_list) > _page_size else None
+            project_list = project_list[:_page_size]
+
+            etag = list_etag('project', project_list, next_cursor)
+            if not_modified(etag):
+                return not_modified_response(etag)
+
+            project_count = len(project_list)
+            projects_to_return = json_array([Project.fragment(proj) for proj in project_list])
+
+        if project_count == 0:
+            return list_response("projects", b'[]', headers={"ETag": quote_etag(etag)},
+                                 next_cursor=None,
+                                 msg="There are no projects to return")
+        return list_response("projects", projects_to_return, headers={"ETag": quote_etag(etag)},
+                             next_cursor=next_cursor,
+                             msg="Projects of the current user successfully listed")
 
 @project_api.route('/view')
 class ViewProject(Resource):
@@ -315,12 +593,15 @@ class ViewProject(Resource):
 
         _project_id = req_data.get('projectID')
 
-        requested_project = Project.get_by_id(_project_id, self.id)
+        requested_project = cached_read(f'project:{self.id}:{_project_id}', partial(load_project, self.id, _project_id))
 
         if requested_project:
+            etag = requested_project["etag"]
+            if not_modified(etag):
+                return not_modified_response(etag)
             return {"success": True,
-             "project": requested_project.toJSON(),
-             "msg": "Project content returned successfully"}, 200
+             "project": requested_project["project"],
+             "msg": "Project content returned successfully"}, 200, {"ETag": quote_etag(etag)}
         else:
             return {"success": False,
                     "msg": "No such project found in the scope of this user"}, 404
@@ -344,15 +625,19 @@ class UpdateProject(Resource):
         project = Project.get_by_id(_project_id, self.id)
         
         if project:
+            if precondition_failed(resource_etag('project', project)):
+                return {"success": False,
+                        "msg": "Project was modified since it was read"}, 412
             if project_name_exists:
                 return {"success": False,
                         "msg": "A project with the same name already exists"}, 400
             else:
                 project.set_project_name(_new_project_name)
                 project.save()
+                invalidate_reads(project_tag(project.id))
                 return {"success": True,
                         "project_name": project.project_name,
-                        "msg": "Project successfully edited"}, 200
+                        "msg": "Project successfully edited"}, 200, {"ETag": quote_etag(resource_etag('project', project))}
         else:
             return {"success": False,
                         "msg": "No such project exists in the scope of the user"}, 404
@@ -374,19 +659,85 @@ class DeleteProject(Resource):
         project = Project.get_by_id(_project_id, self.id)
         
         if project:
+            deleted_issues = Issue.delete_issues_of_project(project.id)
             project.delete_project()
-            related_issues = Issue.get_issues_by_project_id(self.id)
-            for issue in related_issues:
-                issue.delete_issue()
-                issue.save()
-                project.decrement_issue_count()
             project.save()
+            invalidate_reads(project_tag(project.id), project_issues_tag(project.id))
             return {"success": True,
+                    "deleted_issues": deleted_issues,
                     "msg": "Project and related issues deleted successfully"}, 200
         else:
             return {"success": False,
                         "msg": "No such project exists in the scope of the user"}, 404
 
+@project_api.route('/stats')
+class ProjectStats(Resource):
+    '''
+        Issue counts by status and by type for one or all projects of the user
+    '''
+
+    @project_api.expect(project_stats_parser)
+    @token_required
+    def get(self, current_user):
+
+        req_args = project_stats_parser.parse_args()
+
+        _project_id = req_args.get('projectID')
+
+        # one row per project and non-empty (status, type) pair, read from the counter table
+        projects = {}
+        for row in IssueBreakdown.get_by_creator(self.id, _project_id):
+            stats = projects.get(row.id)
+            if stats is None:
+                stats = projects[row.id] = {"_id": row.id,
+                                            "project_name": row.project_name,
+                                            "number_of_issues": row.number_of_issues,
+                                            "by_status": {},
+                                            "by_type": {}}
+            if row.issue_count:
+                stats["by_status"][row.issue_status] = stats["by_status"].get(row.issue_status, 0) + row.issue_count
+                stats["by_type"][row.issue_type] = stats["by_type"].get(row.issue_type, 0) + row.issue_count
+
+        if _project_id is not None and not projects:
+            return {"success": False,
+                    "msg": "No such project found in the scope of this user"}, 404
+        return {"success": True,
+                "projects": list(projects.values()),
+                "msg": "Issue statistics returned successfully"}, 200
+
+def export_line(kind, model, row):
+    if row.deleted:
+        record = {"type": kind, "_id": row.id, "deleted": True}
+    else:
+        record = {"type": kind, **model.serialize(row)}
+    return dumps(record) + b'\n'
+
+@project_api.route('/export')
+class ExportProjects(Resource):
+    '''
+        Streams projects and issues of the user as newline delimited JSON
+    '''
+
+    @project_api.expect(project_export_parser)
+    @token_required
+    def get(self, current_user):
+
+        req_args = project_export_parser.parse_args()
+
+        _since = utc_naive(req_args.get('since'))
+        _user_id = self.id
+
+        # rows are fetched in batches while the response is being sent, so memory stays flat
+        def generate():
+            projects = Project.with_list_columns(Project.get_for_export(_user_id, _since), 'deleted')
+            for project in projects.yield_per(BaseConfig.EXPORT_BATCH_SIZE):
+                yield export_line('project', Project, project)
+            issues = Issue.with_list_columns(Issue.get_for_export(_user_id, _since), 'deleted')
+            for issue in issues.yield_per(BaseConfig.EXPORT_BATCH_SIZE):
+                yield export_line('issue', Issue, issue)
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 '''
     Flask-Restx Issue API routes
 '''
@@ -414,9 +765,9 @@ class CreateIssue(Resource):
         else:         
             new_issue = Issue(issue_title = _issue_title, issue_type = _issue_type,
                             parent_project = _parent_project, created_by = self.id)
+            Project.adjust_issue_count(existing_project.id, 1)
             new_issue.save()
-            existing_project.increment_issue_count()
-            existing_project.save()
+            invalidate_reads(project_tag(existing_project.id))
 
             return {"success": True,
                     "issueID": new_issue.id,
@@ -427,6 +778,45 @@ class CreateIssue(Resource):
                     "created_by": new_issue.created_by,
                     "msg": "Issue successfully created"}, 200
 
+@issue_api.route('/bulkcreate')
+class BulkCreateIssues(Resource):
+    '''
+        Creates many issues at once using 'IssueBulkCreateModel' input, reports the result of every item
+    '''
+
+    @issue_api.expect(issue_bulk_create_model, validate=True)
+    @token_required
+    def post(self, current_user):
+
+        req_data = request.get_json()
+
+        _issues = req_data.get('issues')
+
+        _parent_ids = [parse_id(issue['parent_project']) for issue in _issues]
+        accessible_projects = Project.get_ids_by_creator({pid for pid in _parent_ids if pid is not None}, self.id)
+
+        results = []
+        rows = []
+        for index, (issue, parent_id) in enumerate(zip(_issues, _parent_ids)):
+            if parent_id in accessible_projects:
+                rows.append({"issue_title": issue['issue_title'], "issue_type": issue['issue_type'],
+                             "parent_project": parent_id, "created_by": self.id})
+                results.append({"index": index, "success": True})
+            else:
+                results.append({"index": index, "success": False,
+                                "msg": "No such project exists in the scope of the user, cannot create the issue"})
+
+        if rows:
+            new_ids = iter(Issue.create_many(rows))
+            invalidate_reads(*{project_tag(row["parent_project"]) for row in rows})
+            for result in results:
+                if result["success"]:
+                    result["issueID"] = next(new_ids)
+
+        return {"success": True,
+                "results": results,
+                "msg": f"{len(rows)} issues successfully created, {len(results) - len(rows)} failed"}, 200
+
 @issue_api.route('/view')
 class ViewIssue(Resource):
     '''
@@ -441,22 +831,119 @@ class ViewIssue(Resource):
 
         _issue_id = req_data.get('issueID')
 
-        requested_issue = Issue.get_by_id(_issue_id)
+        requested_issue = cached_read(f'issue:{self.id}:{_issue_id}', partial(load_issue, self.id, _issue_id))
 
         if requested_issue:
-            _parent_project_id = requested_issue.parent_project
-            parent_project = Project.get_by_id(_parent_project_id, self.id)
-            if parent_project:
-                return {"success": True,
-                        "issue": requested_issue.toJSON(),
-                        "msg": "Issue content returned successfully"}, 200
-            else:
-                return {"success": False,
-                        "msg": "Cannot reach issue since user has no access to parent project"}, 404
+            etag = requested_issue["etag"]
+            if not_modified(etag):
+                return not_modified_response(etag)
+            return {"success": True,
+                    "issue": requested_issue["issue"],
+                    "msg": "Issue content returned successfully"}, 200, {"ETag": quote_etag(etag)}
+        elif Issue.get_by_id(_issue_id):
+            return {"success": False,
+                    "msg": "Cannot reach issue since user has no access to parent project"}, 404
         else:
             return {"success": False,
                     "msg": "No such issue found in this project"}, 404
 
+@issue_api.route('/list')
+class ListIssues(Resource):
+    '''
+        Lists issues of a project that a user has access to, filtered, sorted and paginated
+    '''
+
+    @issue_api.expect(issue_list_parser)
+    @token_required
+    def get(self, current_user):
+
+        req_args = issue_list_parser.parse_args()
+
+        _project_id = req_args.get('projectID')
+        _sort = req_args.get('sort')
+        _cursor = req_args.get('cursor')
+
+        if not Project.get_by_id(_project_id, self.id):
+            return {"success": False,
+                    "msg": "No such project found in the scope of this user"}, 404
+
+        _after = None
+        if _cursor:
+            try:
+                cursor_values = decode_cursor(_cursor)
+                if cursor_values["sort"] != _sort:
+                    raise InvalidCursor(_cursor)
+                _after = [sqlite_integer(cursor_values["id"])]
+                if _sort.lstrip('-') == 'date_created':
+                    _after.insert(0, utc_naive(datetime.fromisoformat(cursor_values["date_created"])))
+            except (InvalidCursor, KeyError, TypeError, ValueError):
+                return {"success": False,
+                        "msg": "Invalid pagination cursor"}, 400
+
+        _page_size = page_size(req_args.get('limit'), BaseConfig.LIST_PAGE_SIZE, BaseConfig.LIST_MAX_PAGE_SIZE)
+        # one extra row tells whether there is a next page
+        issue_page = Issue.get_page_by_project(_project_id, _page_size + 1, sort=_sort, after=_after,
+                                               issue_status=req_args.get('issue_status'),
+                                               issue_type=req_args.get('issue_type'),
+                                               created_by=req_args.get('created_by'),
+                                               created_after=utc_naive(req_args.get('created_after')),
+                                               created_before=utc_naive(req_args.get('created_before')))
+        issue_list = Issue.with_list_columns(issue_page, 'date_created').all()
+
+        next_cursor = None
+        if len(issue_list) > _page_size:
+            last_issue = issue_list[_page_size - 1]
+            cursor_values = {"sort": _sort, "id": last_issue.id}
+            if _sort.lstrip('-') == 'date_created':
+                cursor_values["date_created"] = last_issue.date_created.isoformat()
+            next_cursor = encode_cursor(cursor_values)
+            issue_list = issue_list[:_page_size]
+
+        etag = list_etag('issue', issue_list, next_cursor)
+        if not_modified(etag):
+            return not_modified_response(etag)
+
+        if len(issue_list) == 0:
+            return list_response("issues", b'[]', headers={"ETag": quote_etag(etag)},
+                                 next_cursor=None,
+                                 msg="There are no issues to return")
+        return list_response("issues", json_array([Issue.fragment(issue) for issue in issue_list]),
+                             headers={"ETag": quote_etag(etag)},
+                             next_cursor=next_cursor,
+                             msg="Issues of the project successfully listed")
+
+@issue_api.route('/search')
+class SearchIssues(Resource):
+    '''
+        Full text search over the titles of issues that a user has access to, best matches first
+    '''
+
+    @issue_api.expect(issue_search_parser)
+    @token_required
+    def get(self, current_user):
+
+        req_args = issue_search_parser.parse_args()
+
+        _terms = re.findall(r'\w+', req_args.get('q'))
+        _page = max(req_args.get('page'), 1)
+        _page_size = page_size(req_args.get('limit'), BaseConfig.LIST_PAGE_SIZE, BaseConfig.LIST_MAX_PAGE_SIZE)
+
+        if not _terms:
+            return {"success": False,
+                    "msg": "Search query has no words to search for"}, 400
+
+        if (_page - 1) * _page_size > SQLITE_INTEGER_MAX:
+            return {"success": False,
+                    "msg": "Page number is out of range"}, 400
+
+        # one extra row tells whether there is a next page
+        found_issues = Issue.search(self.id, _terms, _page_size + 1, offset=(_page - 1) * _page_size,
+                                    project_id=req_args.get('projectID'))
+
+        return list_response("issues", json_array([Issue.fragment(issue) for issue in found_issues[:_page_size]]),
+                             next_page=_page + 1 if len(found_issues) > _page_size else None,
+                             msg="Search results returned successfully")
+
 @issue_api.route('/edit')
 class UpdateIssue(Resource):
     '''
@@ -481,6 +968,9 @@ class UpdateIssue(Resource):
             _parent_project_id = issue_to_edit.parent_project
             parent_project = Project.get_by_id(_parent_project_id, self.id)
             if parent_project:
+                if precondition_failed(resource_etag('issue', issue_to_edit)):
+                    return {"success": False,
+                            "msg": "Issue was modified since it was read"}, 412
                 if _new_issue_title or _new_issue_type or _new_issue_status or _new_issue_parent:
                     success_msg_content = "Successfully updated"
                     if _new_issue_title:
@@ -495,21 +985,22 @@ class UpdateIssue(Resource):
                     if _new_issue_parent:
                         new_parent_project = Project.get_by_id(_new_issue_parent, self.id)
                         if new_parent_project:
-                            issue_to_edit.update_parent_project(_new_issue_parent)
-                            parent_project.decrement_issue_count()
-                            parent_project.save()
-                            new_parent_project.increment_issue_count()
-                            new_parent_project.save()
+                            if new_parent_project.id != parent_project.id:
+                                issue_to_edit.update_parent_project(new_parent_project.id)
+                                Project.adjust_issue_count(parent_project.id, -1)
+                                Project.adjust_issue_count(new_parent_project.id, 1)
+                                invalidate_reads(project_tag(parent_project.id), project_tag(new_parent_project.id))
                             success_msg_content = success_msg_content + " parent project"
                         else:
                             return {"success": False,
                                     "msg": "Cannot change to new parent project since it is not accessible by user"}, 404
                     issue_to_edit.save()
+                    invalidate_reads(issue_tag(issue_to_edit.id))
                 else:
                     success_msg_content = "Nothing to update"                    
                 return {"success": True,
                         "updated issue": issue_to_edit.toJSON(),
-                        "msg": success_msg_content}, 200
+                        "msg": success_msg_content}, 200, {"ETag": quote_etag(resource_etag('issue', issue_to_edit))}
             else:
                 return {"success": False,
                         "msg": "Cannot reach issue since user has no access to parent project"}, 404
@@ -517,6 +1008,84 @@ class UpdateIssue(Resource):
             return {"success": False,
                     "msg": "No such issue found in this project"}, 404
 
+@issue_api.route('/bulkedit')
+class BulkUpdateIssues(Resource):
+    '''
+        Applies the same changes to a list of issues or to the issues matching a filter, all or nothing
+    '''
+
+    @issue_api.expect(issue_bulk_edit_model, validate=True)
+    @token_required
+    def post(self, current_user):
+
+        req_data = request.get_json()
+
+        _issue_ids = req_data.get('issueIDs')
+        _filter = req_data.get('filter') or {}
+        _new_issue_title = req_data.get('issue_title')
+        _new_issue_type = req_data.get('issue_type')
+        _new_issue_status = req_data.get('issue_status')
+        _new_issue_parent = req_data.get('parent_project')
+
+        if _issue_ids is None and not _filter:
+            return {"success": False,
+                    "msg": "Either issueIDs or filter is required"}, 400
+
+        if _issue_ids is not None:
+            _issue_ids = {parse_id(issue_id) or -1 for issue_id in _issue_ids}
+
+        if _filter and not Project.get_by_id(_filter.get('projectID'), self.id):
+            return {"success": False,
+                    "msg": "No such project found in the scope of this user"}, 404
+
+        selection = Issue.select_accessible(self.id, issue_ids=_issue_ids,
+                                            project_id=_filter.get('projectID'),
+                                            issue_status=_filter.get('issue_status'),
+                                            issue_type=_filter.get('issue_type'))
+        selected_per_project = Issue.count_by_project(selection)
+        selected_count = sum(selected_per_project.values())
+
+        if _issue_ids is not None and selected_count != len(_issue_ids):
+            return {"success": False,
+                    "msg": "Some issues cannot be reached since user has no access to them"}, 404
+
+        changes = {}
+        if _new_issue_title:
+            changes[Issue.issue_title] = _new_issue_title
+        if _new_issue_type:
+            changes[Issue.issue_type] = _new_issue_type
+        if _new_issue_status:
+            changes[Issue.issue_status] = _new_issue_status
+        if _new_issue_parent:
+            new_parent_project = Project.get_by_id(_new_issue_parent, self.id)
+            if not new_parent_project:
+                return {"success": False,
+                        "msg": "Cannot change to new parent project since it is not accessible by user"}, 404
+            changes[Issue.parent_project] = new_parent_project.id
+
+        if not changes or selected_count == 0:
+            return {"success": True,
+                    "updated": 0,
+                    "msg": "Nothing to update"}, 200
+
+        Issue.update_many(selection, changes)
+        invalidate_reads(*(project_issues_tag(project_id) for project_id in selected_per_project))
+
+        if _new_issue_parent:
+            moved_count = 0
+            for project_id, count in selected_per_project.items():
+                if project_id != new_parent_project.id:
+                    Project.adjust_issue_count(project_id, -count)
+                    invalidate_reads(project_tag(project_id))
+                    moved_count += count
+            if moved_count:
+                Project.adjust_issue_count(new_parent_project.id, moved_count)
+                invalidate_reads(project_tag(new_parent_project.id))
+
+        return {"success": True,
+                "updated": selected_count,
+                "msg": f"Successfully updated {selected_count} issues"}, 200
+
 @issue_api.route('/delete')
 class DeleteIssue(Resource):
     '''
@@ -538,9 +1107,9 @@ class DeleteIssue(Resource):
             parent_project = Project.get_by_id(_parent_project_id, self.id)
             if parent_project:
                 issue_to_delete.delete_issue()
+                Project.adjust_issue_count(parent_project.id, -1)
                 issue_to_delete.save()
-                parent_project.decrement_issue_count()
-                parent_project.save()
+                invalidate_reads(issue_tag(issue_to_delete.id), project_tag(parent_project.id))
                 return {"success": True,
                         "msg": "Issue deleted successfully"}, 200
             else:
@@ -548,4 +1117,37 @@ class DeleteIssue(Resource):
                         "msg": "Cannot reach issue since user has no access to parent project"}, 404
         else:
             return {"success": False,
-                    "msg": "No such issue found in this project"}, 404
\ No newline at end of file
+                    "msg": "No such issue found in this project"}, 404
+
+'''
+    Flask-Restx Metrics API routes
+'''
+
+@metrics_api.route('/cache')
+class CacheMetrics(Resource):
+    '''
+        Returns hit/miss counters of the in-process caches
+    '''
+
+    @token_required
+    def get(self, current_user):
+
+        return {"success": True,
+                "token_cache": token_cache.stats(),
+                "read_cache": read_cache.stats(),
+                "fragment_cache": fragment_cache.stats(),
+                "msg": "Cache metrics returned successfully"}, 200
+
+@metrics_api.route('/blocklist')
+class BlocklistMetrics(Resource):
+    '''
+        Returns the size of the JWT token blocklist
+    '''
+
+    @token_required
+    def get(self, current_user):
+
+        return {"success": True,
+                "blocklist_size": JWTTokenBlocklist.count(),
+                "revocation_filter": revocation_filter.stats(),
+                "msg": "Blocklist metrics returned successfully"}, 200
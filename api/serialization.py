@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import json
+import threading
+
+from collections import OrderedDict
+
+from flask import Response, make_response
+
+from .config import BaseConfig
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+    JSON representation of the API. orjson is used when it is installed, it
+    encodes several times faster than the standard library and returns bytes
+    that are sent as they are. Error bodies are reshaped on the Python object
+    before they are encoded.
+'''
+
+
+def _stdlib_dumps(data):
+    return json.dumps(data).encode()
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+JSON_BACKENDS = {'stdlib': _stdlib_dumps}
+if orjson is not None:
+    JSON_BACKENDS['orjson'] = _orjson_dumps
+
+
+def get_dumps(backend):
+    '''
+        Encoder of the JSON backend, 'auto' picks orjson when it is installed
+    '''
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'stdlib'
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f'JSON backend {backend} is not available')
+    return JSON_BACKENDS[backend]
+
+
+dumps = get_dumps(BaseConfig.JSON_BACKEND)
+
+
+def error_envelope(data):
+    '''
+        Validation errors of Flask-RESTX are sent in the {"success", "msg"} format of the API
+    '''
+    if isinstance(data, dict) and "errors" in data:
+        return {"success": False,
+                "msg": next(iter(data["errors"].values()))}
+    return data
+
+
+def output_json(data, code, headers=None):
+    if code >= 400:
+        data = error_envelope(data)
+    response = make_response(dumps(data) + b'\n', code)
+    response.headers.extend(headers or {})
+    return response
+
+
+class FragmentCache():
+    '''
+        Pre-encoded JSON of rows, bounded by the total size of the fragments. An entry
+        holds the fragment of one version of a row: every edit and soft delete bumps
+        the version, so a lookup with a newer version misses and replaces the entry.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table, row_id, version, build):
+        '''
+            The fragment of the row version, encoding build() on a miss
+        '''
+        key = (table, row_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        fragment = dumps(build())
+        if len(fragment) <= self.max_bytes:
+            with self._lock:
+                self._remove(key)
+                self._entries[key] = (version, fragment)
+                self.size_bytes += len(fragment)
+                while self.size_bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "size_bytes": self.size_bytes,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[1])
+
+
+fragment_cache = FragmentCache(BaseConfig.FRAGMENT_CACHE_BYTES)
+
+
+def json_array(fragments):
+    return b'[' + b','.join(fragments) + b']'
+
+
+def list_response(name, items, headers=None, **fields):
+    '''
+        {"success": true, name: items, **fields} where items is an encoded JSON array,
+        the list is sent without decoding or encoding its elements again
+    '''
+    body = b''.join((b'{"success":true,"', name.encode(), b'":', items, b',', dumps(fields)[1:], b'\n'))
+    response = Response(body, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Bytes on the wire and CPU time per request of the list and export
+    endpoints for every negotiated encoding, served by the application on a
+    throwaway database.
+
+    Usage: python -m benchmarks.compression [--issues 5000] [--requests 200]
+'''
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from api import app
+from api.compression import ENCODINGS
+from api.config import BaseConfig
+
+ENDPOINTS = (
+    ('issue list of 50', 'api/issue/list?projectID={project}'),
+    ('issue list of 200', 'api/issue/list?projectID={project}&limit=200'),
+    ('project list', 'api/project/listall'),
+    ('export', 'api/project/export'),
+)
+
+
+def post(client, url, data, headers=None):
+    response = client.post(url, data=json.dumps(data), headers=headers, content_type='application/json')
+    return json.loads(response.data)
+
+
+def seed(client, issues):
+    user = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+    post(client, 'api/users/register', user)
+    token = post(client, 'api/users/login', {"email": user["email"], "password": user["password"]})["token"]
+    headers = {"authorization": token}
+    project = post(client, 'api/project/create', {"project_name": "bench"}, headers)["projectID"]
+    for start in range(0, issues, BaseConfig.BULK_MAX_ITEMS):
+        batch = [{"issue_title": f"issue {i}", "issue_type": "Bug", "parent_project": str(project)}
+                 for i in range(start, min(start + BaseConfig.BULK_MAX_ITEMS, issues))]
+        post(client, 'api/issue/bulkcreate', {"issues": batch}, headers)
+    return headers, project
+
+
+def measure(client, url, headers, requests):
+    size = 0
+    started = time.process_time()
+    for _ in range(requests):
+        size = len(client.get(url, headers=headers).data)
+    return size, (time.process_time() - started) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--issues', type=int, default=5000, help='Issues in the benchmarked project')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        client = app.test_client()
+        headers, project = seed(client, args.issues)
+
+        for name, url in ENDPOINTS:
+            url = url.format(project=project)
+            print(name)
+            requests = max(1, args.requests // 20) if name == 'export' else args.requests
+            baseline = None
+            for encoding in ('identity',) + ENCODINGS:
+                size, cpu = measure(client, url, dict(headers, **{"Accept-Encoding": encoding}), requests)
+                baseline = baseline or size
+                print(f'  {encoding:<9} {size:12,} bytes  {baseline / size:5.1f}x  {cpu:8.2f} ms CPU/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Cost of encoding response bodies: the former path (stdlib encoding, error
+    bodies parsed again and re-encoded in after_request) against the current
+    representation with each available JSON backend.
+
+    Usage: python -m benchmarks.json_encoding [--number 20000]
+'''
+
+import argparse
+import json
+import timeit
+
+from api.serialization import JSON_BACKENDS, error_envelope
+
+PAYLOADS = {
+    'validation error': ({"errors": {"email": "'email' is a required property"},
+                          "message": "Input payload validation failed"}, 400),
+    'project view': ({"success": True,
+                      "project": {"_id": 1, "project_name": "project 1", "number_of_issues": 12},
+                      "msg": "Project content returned successfully"}, 200),
+    'issue list of 200': ({"success": True,
+                           "issues": [{"_id": i, "issue_title": f"issue {i}", "issue_type": "Bug",
+                                       "issue_status": "To Do", "parent_project": 1, "created_by": 1}
+                                      for i in range(200)],
+                           "next_cursor": "eyJpZCI6IDIwMH0",
+                           "msg": "Issues of the project successfully listed"}, 200),
+}
+
+
+def reparse_path(data, code):
+    body = json.dumps(data) + '\n'
+    if code >= 400:
+        response_data = json.loads(body)
+        if "errors" in response_data:
+            response_data = {"success": False,
+                             "msg": list(response_data["errors"].items())[0][1]}
+            body = json.dumps(response_data)
+    return body.encode()
+
+
+def representation_path(dumps):
+    def encode(data, code):
+        if code >= 400:
+            data = error_envelope(data)
+        return dumps(data)
+    return encode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=20000, help='Encodings per measurement')
+    args = parser.parse_args()
+
+    paths = {'stdlib + re-parse': reparse_path}
+    for name, dumps in JSON_BACKENDS.items():
+        paths[name] = representation_path(dumps)
+
+    for payload_name, (data, code) in PAYLOADS.items():
+        print(payload_name)
+        baseline = None
+        for path_name, encode in paths.items():
+            seconds = min(timeit.repeat(lambda: encode(data, code), number=args.number, repeat=3))
+            microseconds = seconds / args.number * 1e6
+            baseline = baseline or microseconds
+            print(f'  {path_name:<18} {microseconds:8.2f} us/response  {baseline / microseconds:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
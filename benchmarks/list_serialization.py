@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Rows per second and peak memory of building the encoded items of an issue
+    list response from ORM instances (toJSON), from the list column rows
+    (serialize) and from cached fragments of these rows, on a throwaway database.
+
+    Usage: python -m benchmarks.list_serialization [--issues 20000] [--repeat 5]
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from api.config import BaseConfig
+from api.models import db, Users, Project, Issue
+from api.serialization import dumps, json_array
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config.from_object(BaseConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    return app
+
+
+def seed(issues):
+    db.create_all()
+    db.session.execute(db.insert(Users), [{"id": 1, "username": "bench", "email": "bench@example.com"}])
+    db.session.execute(db.insert(Project), [{"id": 1, "project_name": "bench", "created_by": 1}])
+    start = datetime.utcnow()
+    db.session.execute(db.insert(Issue), [{"issue_title": f"issue {i}", "issue_type": "Bug", "parent_project": 1,
+                                           "created_by": 1, "date_created": start + timedelta(seconds=i)}
+                                          for i in range(issues)])
+    db.session.commit()
+
+
+def orm_list(limit):
+    return dumps([issue.toJSON() for issue in Issue.get_page_by_project(1, limit, sort='-date_created').all()])
+
+
+def projected_rows(limit):
+    return Issue.with_list_columns(Issue.get_page_by_project(1, limit, sort='-date_created'), 'date_created').all()
+
+
+def projected_list(limit):
+    return dumps([Issue.serialize(row) for row in projected_rows(limit)])
+
+
+def fragment_list(limit):
+    return json_array([Issue.fragment(row) for row in projected_rows(limit)])
+
+
+def measure(build, limit, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build(limit)
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    build(limit)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return limit / best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--issues', type=int, default=20000, help='Issues in the listed project')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, the best one is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'bench.db'))
+        with app.app_context():
+            seed(args.issues)
+            for limit in (50, 200, args.issues):
+                print(f'{limit} issues per response')
+                for name, build in (('toJSON', orm_list), ('serialize', projected_list), ('fragments', fragment_list)):
+                    rows_per_second, peak = measure(build, limit, args.repeat)
+                    print(f'  {name:<10} {rows_per_second:12,.0f} rows/s  peak {peak / 1024:10,.1f} KiB')
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Throughput and latency of the gunicorn serving profiles on the same
+    throwaway dataset: client processes keep requesting an issue list page
+    (and create an issue every tenth request in the mixed workload) against
+    gunicorn started with gunicorn-cfg.py and each GUNICORN_PROFILE.
+
+    Usage: python -m benchmarks.serving [--clients 16] [--seconds 10] [--profiles sync gthread gevent]
+'''
+
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+PORT = 5055
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def bench_app():
+    '''
+        The application on the database of the BENCH_DATABASE environment variable, loaded by gunicorn
+    '''
+    from api import app
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.environ['BENCH_DATABASE']
+    return app
+
+
+def prepare(path, issues):
+    os.environ['BENCH_DATABASE'] = path
+    from api import db
+    from benchmarks.compression import seed
+
+    app = bench_app()
+    headers, project = seed(app.test_client(), issues)
+    with app.app_context():
+        db.engine.dispose()
+    return headers, project
+
+
+def start_server(profile, path):
+    env = dict(os.environ, GUNICORN_PROFILE=profile, GUNICORN_BIND=f'127.0.0.1:{PORT}',
+               GUNICORN_LOGLEVEL='warning', BENCH_DATABASE=path,
+               CACHE_SHARED_PATH=os.path.join(os.path.dirname(path), 'cache.db'))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn-cfg.py', '--access-logfile', os.devnull,
+                               'benchmarks.serving:bench_app()'], cwd=ROOT, env=env)
+    for _ in range(100):
+        if server.poll() is not None:
+            break
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            connection.request('GET', '/api/metrics/cache')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'gunicorn did not start with the {profile} profile')
+
+
+def client(headers, project, write_every, stop_at, results):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    list_url = f'/api/issue/list?projectID={project}'
+    create_body = json.dumps({"issue_title": "bench", "issue_type": "Bug", "parent_project": str(project)})
+    latencies = []
+    errors = 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            if write_every and len(latencies) % write_every == write_every - 1:
+                connection.request('POST', '/api/issue/create', create_body,
+                                   dict(headers, **{"Content-Type": "application/json"}))
+            else:
+                connection.request('GET', list_url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+        latencies.append(time.perf_counter() - started)
+    results.put((latencies, errors))
+
+
+def measure(headers, project, clients, seconds, write_every):
+    results = multiprocessing.Queue()
+    stop_at = time.time() + seconds
+    processes = [multiprocessing.Process(target=client, args=(headers, project, write_every, stop_at, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in range(clients)]
+    for process in processes:
+        process.join()
+    latencies = sorted(latency for client_latencies, _ in totals for latency in client_latencies)
+    errors = sum(client_errors for _, client_errors in totals)
+    return (len(latencies) / seconds, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--issues', type=int, default=5000, help='Issues in the benchmarked project')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent client processes')
+    parser.add_argument('--seconds', type=int, default=10, help='Duration of each measurement')
+    parser.add_argument('--profiles', nargs='+', default=['sync', 'gthread', 'gevent'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        headers, project = prepare(path, args.issues)
+        for profile in args.profiles:
+            if profile == 'gevent' and importlib.util.find_spec('gevent') is None:
+                print(f'{profile}: skipped, gevent is not installed')
+                continue
+            server = start_server(profile, path)
+            try:
+                print(profile)
+                for workload, write_every in (('read', 0), ('mixed', 10)):
+                    rps, p50, p99, errors = measure(headers, project, args.clients, args.seconds, write_every)
+                    print(f'  {workload:<6} {rps:10,.0f} req/s  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  {errors} errors')
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
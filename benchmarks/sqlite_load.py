@@ -0,0 +1,100 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+'''
+    Read throughput of the SQLite engine profiles while another process
+    writes in bursts, the way several gunicorn workers share apidata.db.
+
+    Usage: python -m benchmarks.sqlite_load [--readers 4] [--seconds 3]
+'''
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from api.config import BaseConfig
+from api.database import apply_sqlite_pragmas
+
+ISSUES = 20000
+
+
+def connect(path, profile):
+    connection = sqlite3.connect(path, timeout=BaseConfig.SQLITE_BUSY_TIMEOUT / 1000)
+    apply_sqlite_pragmas(connection, BaseConfig.SQLITE_PROFILES[profile])
+    return connection
+
+
+def seed(path, profile):
+    connection = connect(path, profile)
+    connection.execute('CREATE TABLE issue (id INTEGER PRIMARY KEY, issue_title VARCHAR(32), '
+                       'parent_project INTEGER, deleted BOOLEAN NOT NULL)')
+    connection.execute('CREATE INDEX ix_issue_project_live ON issue (parent_project) WHERE deleted = 0')
+    connection.executemany('INSERT INTO issue (issue_title, parent_project, deleted) VALUES (?, ?, 0)',
+                           ((f'issue {i}', i % 100) for i in range(ISSUES)))
+    connection.commit()
+    connection.close()
+
+
+def reader(path, profile, stop_at, results):
+    connection = connect(path, profile)
+    reads = errors = 0
+    while time.time() < stop_at:
+        try:
+            connection.execute('SELECT id, issue_title FROM issue WHERE parent_project = ? AND deleted = 0',
+                               (random.randrange(100),)).fetchall()
+            reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put((reads, errors))
+
+
+def writer(path, profile, stop_at):
+    connection = connect(path, profile)
+    while time.time() < stop_at:
+        try:
+            # updates keep the table size constant so read cost only changes through locking
+            connection.executemany('UPDATE issue SET issue_title = ? WHERE id = ?',
+                                   ((f'burst {time.time()}', random.randrange(1, ISSUES)) for _ in range(50)))
+            connection.commit()
+        except sqlite3.OperationalError:
+            connection.rollback()
+
+
+def measure(path, profile, readers, seconds, with_writer):
+    results = multiprocessing.Queue()
+    stop_at = time.time() + seconds
+    processes = [multiprocessing.Process(target=reader, args=(path, profile, stop_at, results)) for _ in range(readers)]
+    if with_writer:
+        processes.append(multiprocessing.Process(target=writer, args=(path, profile, stop_at)))
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in range(readers)]
+    for process in processes:
+        process.join()
+    return sum(r for r, _ in totals) / seconds, sum(e for _, e in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    print(f'{"profile":<12}{"reads/s idle":>14}{"reads/s writing":>17}{"ratio":>8}{"lock errors":>13}')
+    for profile in BaseConfig.SQLITE_PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.db')
+            seed(path, profile)
+            idle, _ = measure(path, profile, args.readers, args.seconds, with_writer=False)
+            busy, errors = measure(path, profile, args.readers, args.seconds, with_writer=True)
+            print(f'{profile:<12}{idle:>14.0f}{busy:>17.0f}{busy / idle:>8.2f}{errors:>13}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,89 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-bind = '0.0.0.0:5005'
-workers = 1
+import os
+
+# Serving profile, selected with GUNICORN_PROFILE:
+# 'sync' one request per process, 'gthread' (default) a thread pool per process,
+# 'gevent' cooperative connections per process (needs the gevent package)
+PROFILE = os.getenv('GUNICORN_PROFILE', 'gthread')
+
+if PROFILE == 'gevent':
+    # before the application is preloaded, so its locks and the connection pool wait cooperatively
+    from gevent import monkey
+    monkey.patch_all()
+
+import multiprocessing
+
+CPU_COUNT = multiprocessing.cpu_count()
+
+PROFILES = {
+    'sync': {'worker_class': 'sync',
+             'workers': 2 * CPU_COUNT + 1,
+             'threads': 1},
+    # a thread per pooled SQLite connection of the worker
+    'gthread': {'worker_class': 'gthread',
+                'workers': CPU_COUNT,
+                'threads': int(os.getenv('DB_POOL_SIZE', 5))},
+    'gevent': {'worker_class': 'gevent',
+               'workers': CPU_COUNT,
+               'threads': 1},
+}
+
+if PROFILE not in PROFILES:
+    raise ValueError(f'Unknown gunicorn profile {PROFILE}, expected one of {", ".join(PROFILES)}')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5005')
+worker_class = PROFILES[PROFILE]['worker_class']
+workers = int(os.getenv('GUNICORN_WORKERS', PROFILES[PROFILE]['workers']))
+threads = int(os.getenv('GUNICORN_THREADS', PROFILES[PROFILE]['threads']))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+if PROFILE == 'gevent':
+    # pool_size and max_overflow together allow a connection per concurrent request
+    os.environ.setdefault('DB_POOL_SIZE', str(max(worker_connections // 2, 1)))
+
+# Caches of separate workers must see each other's invalidations, local ones are per process
+os.environ.setdefault('CACHE_BACKEND', 'shared' if workers > 1 else 'local')
+if workers > 1 and os.environ['CACHE_BACKEND'] == 'local':
+    raise ValueError(f'CACHE_BACKEND=local serves stale reads with {workers} workers, use the shared backend')
+
+# Password hashing processes of each worker, together one per CPU
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(CPU_COUNT // workers, 1)))
+
+# The application is imported once by the master and forked into the workers
+preload_app = True
+
+# Workers are replaced after a number of requests, the jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
 accesslog = '-'
-loglevel = 'debug'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
 capture_output = True
 enable_stdio_inheritance = True
+
+
+def on_starting(server):
+    '''
+        Creates missing tables and applies migrations once in the master, before any
+        worker is forked, so workers never race on creating the schema of a new database
+    '''
+    from api import app, db
+    from api.migrations import upgrade
+
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    '''
+        Drops the connections a worker inherits from the preloaded application, each
+        worker opens its own. close=False leaves the parent's connections untouched.
+    '''
+    from api import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -4,10 +4,19 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+import gzip
 import pytest
 import json
 
+from datetime import datetime, timedelta, timezone
+
 from api import app
+from api.bloom import RevocationFilter
+from api.cache import SharedCache
+from api.config import BaseConfig
+from api.serialization import FragmentCache
+from api.pagination import encode_cursor
+from api.models import db, Users, Project, Issue, IssueBreakdown, JWTTokenBlocklist
 
 """
    Sample test data
@@ -98,6 +107,64 @@ def test_user_signup(client):
     assert response.status_code == 200
     assert "The user was successfully registered" in data["msg"]
 
+def test_user_signup_existing_email(client):
+    """
+    Tests /users/register API: email of a registered user
+    """
+    response = client.post(
+        "api/users/register",
+        data=json.dumps(
+            {
+                "username": DUMMY_USERNAME + '_other',
+                "email": DUMMY_EMAIL,
+                "password": DUMMY_PASS
+            }
+        ),
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Email already taken" in data["msg"]
+
+def test_user_signup_existing_username(client):
+    """
+    Tests /users/register API: username of a registered user
+    """
+    response = client.post(
+        "api/users/register",
+        data=json.dumps(
+            {
+                "username": DUMMY_USERNAME,
+                "email": DUMMY_EMAIL + '_other',
+                "password": DUMMY_PASS
+            }
+        ),
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Username already taken" in data["msg"]
+
+def test_user_signup_existing_email_not_hashed(client, monkeypatch):
+    """
+    Tests /users/register API: a taken email is refused before the password is hashed
+    """
+    hashed = []
+    monkeypatch.setattr("api.models.hash_password", hashed.append)
+    response = client.post(
+        "api/users/register",
+        data=json.dumps(
+            {
+                "username": DUMMY_USERNAME + '_other',
+                "email": DUMMY_EMAIL,
+                "password": DUMMY_PASS
+            }
+        ),
+        content_type="application/json")
+
+    assert response.status_code == 400
+    assert hashed == []
+
 def test_user_signup_invalid_data(client):
     """
     Tests /users/register API: invalid data like email field empty
@@ -701,4 +768,1087 @@ def test_project_delete_valid_project(client, auth_token_new_1):
 
     data = json.loads(response.data.decode())
     assert "Project and related issues deleted successfully" in data["msg"]
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+'''
+    Tests For Auth Token Cache
+'''
+def test_token_cache_hit(client, auth_token_new_1):
+    """
+    Tests that repeated calls with the same token are served from the token cache
+    """
+    for _ in range(2):
+        response = client.get(
+            "api/metrics/cache",
+            headers={"authorization":auth_token_new_1},
+            content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["token_cache"]["hits"] >= 1
+
+def test_token_cache_invalidated_on_logout(client, auth_token_new_1):
+    """
+    Tests that a cached token cannot be used after the user logs out
+    """
+    client.get(
+        "api/metrics/cache",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+    client.post(
+        "api/users/logout",
+        data=json.dumps({}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+    response = client.get(
+        "api/metrics/cache",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Token revoked." in data["msg"]
+
+def test_logged_out_token_is_revoked(client, auth_token_new_1):
+    """
+    Tests that a logged out token stays revoked after the user logs in again
+    """
+    client.post(
+        "api/users/logout",
+        data=json.dumps({}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+    client.post(
+        "api/users/login",
+        data=json.dumps(
+            {
+                "email": DUMMY_EMAIL + '_2',
+                "password": DUMMY_PASS + '_2'
+            }
+        ),
+        content_type="application/json")
+    response = client.get(
+        "api/metrics/cache",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Token revoked." in data["msg"]
+
+def test_revocation_filter_metrics(client, auth_token_new_1):
+    """
+    Tests that the revocation filter reports the revoked tokens it holds
+    """
+    response = client.get(
+        "api/metrics/blocklist",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["revocation_filter"]["items"] >= data["blocklist_size"] > 0
+    assert data["revocation_filter"]["checks"] > data["revocation_filter"]["positives"]
+
+def test_user_login_rehashes_outdated_password(client, monkeypatch):
+    """
+    Tests /users/login API: stored hash is upgraded when the hash method changes
+    """
+    monkeypatch.setattr(BaseConfig, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+    response = client.post(
+        "api/users/login",
+        data=json.dumps(
+            {
+                "email": DUMMY_EMAIL + '_2',
+                "password": DUMMY_PASS + '_2'
+            }
+        ),
+        content_type="application/json")
+
+    assert response.status_code == 200
+    with app.app_context():
+        user = Users.get_by_email(DUMMY_EMAIL + '_2')
+        assert user.password.startswith("pbkdf2:sha256:1000$")
+        assert user.check_password(DUMMY_PASS + '_2')
+
+def test_password_change_expires_other_tokens(client, auth_token_new_1):
+    """
+    Tests that changing the password invalidates tokens issued before the change
+    """
+    other_token = json.loads(client.post(
+        "api/users/login",
+        data=json.dumps(
+            {
+                "email": DUMMY_EMAIL + '_2',
+                "password": DUMMY_PASS + '_2'
+            }
+        ),
+        content_type="application/json").data.decode())["token"]
+    client.post(
+        "api/users/edit",
+        data=json.dumps(
+            {
+                "password": DUMMY_PASS + '_2',
+            },
+        ),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+    response = client.get(
+        "api/metrics/cache",
+        headers={"authorization":other_token},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Token expired." in data["msg"]
+
+'''
+    Tests For Issue Counters
+'''
+def test_issue_counter_follows_issue_changes(client, auth_token_new_1):
+    """
+    Tests that number_of_issues is kept in sync on issue create and delete
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "counter_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    issue_ids = [json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "counted", "issue_type": "Bug", "parent_project": str(project_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"] for _ in range(2)]
+    client.delete(
+        "api/issue/delete",
+        data=json.dumps({"issueID": str(issue_ids[0])}),
+        headers=headers,
+        content_type="application/json")
+    response = client.get(
+        "api/project/view",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert data["project"]["number_of_issues"] == 1
+
+def test_reconcile_issue_counts_command():
+    """
+    Tests that the reconcile command repairs a drifted issue counter
+    """
+    with app.app_context():
+        project = Project.query.filter_by(project_name="counter_proj").first()
+        project.number_of_issues = 42
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["reconcile-issue-counts"])
+
+    assert "Corrected issue counters of 1 projects" in result.output
+    with app.app_context():
+        assert Project.query.filter_by(project_name="counter_proj").first().number_of_issues == 1
+
+'''
+    Tests For Unit Of Work
+'''
+def test_issue_move_commits_once(client, auth_token_new_1, monkeypatch):
+    """
+    Tests that moving an issue to another project is committed in a single transaction
+    """
+    monkeypatch.setitem(app.config, "DEBUG_COMMIT_COUNT", True)
+    headers = {"authorization":auth_token_new_1}
+    project_ids = [json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": name}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"] for name in ("uow_from", "uow_to")]
+    issue_id = json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "moved", "issue_type": "Bug", "parent_project": str(project_ids[0])}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"]
+    response = client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_id), "issue_status": "Done", "parent_project": str(project_ids[1])}),
+        headers=headers,
+        content_type="application/json")
+
+    assert response.status_code == 200
+    assert response.headers["X-DB-Commits"] == "1"
+    with app.app_context():
+        assert [Project.query.get(project_id).number_of_issues for project_id in project_ids] == [0, 1]
+
+def test_project_delete_cascades_to_issues(client, auth_token_new_1):
+    """
+    Tests /project/delete API: live issues of the project are deleted with it
+    """
+    headers = {"authorization":auth_token_new_1}
+    with app.app_context():
+        project_id = Project.query.filter_by(project_name="uow_to", deleted=False).first().id
+    response = client.delete(
+        "api/project/delete",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["deleted_issues"] == 1
+    with app.app_context():
+        assert Issue.get_issues_by_project_id(project_id).count() == 0
+        assert Project.query.get(project_id).number_of_issues == 0
+
+'''
+    Tests For Project Pagination
+'''
+def test_project_list_pages_with_cursor(client, auth_token_new_1):
+    """
+    Tests /project/listall API: pages follow each other without gaps or duplicates
+    """
+    headers = {"authorization":auth_token_new_1}
+    all_ids = [project["_id"] for project in json.loads(client.get(
+        "api/project/listall",
+        headers=headers,
+        content_type="application/json").data.decode())["projects"]]
+
+    paged_ids = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(
+            "api/project/listall?limit=1" + ("&cursor=" + cursor if cursor else ""),
+            headers=headers,
+            content_type="application/json")
+        data = json.loads(response.data.decode())
+        assert response.status_code == 200
+        assert len(data["projects"]) <= 1
+        paged_ids += [project["_id"] for project in data["projects"]]
+        cursor = data["next_cursor"]
+
+    assert len(all_ids) > 1
+    assert paged_ids == all_ids
+
+def test_project_list_invalid_cursor(client, auth_token_new_1):
+    """
+    Tests /project/listall API: malformed cursor
+    """
+    response = client.get(
+        "api/project/listall?cursor=not-a-cursor",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Invalid pagination cursor" in data["msg"]
+
+def test_project_list_out_of_range_cursor(client, auth_token_new_1):
+    """
+    Tests /project/listall API: cursor with an id beyond the range of SQLite integers
+    """
+    response = client.get(
+        "api/project/listall?cursor=" + encode_cursor({"id": 999999999999999999999}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Invalid pagination cursor" in data["msg"]
+
+'''
+    Tests For Issue Listing
+'''
+def test_issue_list_filters_sorts_and_pages(client, auth_token_new_1):
+    """
+    Tests /issue/list API: status filter, descending sort and cursor pagination
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "list_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    issue_ids = [json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "listed_" + str(i), "issue_type": "Bug", "parent_project": str(project_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"] for i in range(5)]
+    client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_ids[0]), "issue_status": "Done"}),
+        headers=headers,
+        content_type="application/json")
+
+    listed_ids = []
+    cursor = None
+    while True:
+        url = "api/issue/list?projectID=%s&issue_status=To Do&sort=-date_created&limit=2" % project_id
+        response = client.get(
+            url + ("&cursor=" + cursor if cursor else ""),
+            headers=headers,
+            content_type="application/json")
+        data = json.loads(response.data.decode())
+        assert response.status_code == 200
+        listed_ids += [issue["_id"] for issue in data["issues"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert listed_ids == list(reversed(issue_ids[1:]))
+
+def test_issue_list_out_of_scope_project(client, auth_token_new_1):
+    """
+    Tests /issue/list API using a deleted project id
+    """
+    response = client.get(
+        "api/issue/list?projectID=1",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 404
+    assert "No such project found in the scope of this user" in data["msg"]
+
+def test_issue_list_created_after_with_offset(client, auth_token_new_1):
+    """
+    Tests /issue/list API: a created_after with a UTC offset is compared as the same instant
+    """
+    with app.app_context():
+        project_id = Project.query.filter_by(project_name="list_proj", deleted=False).first().id
+    hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).astimezone(timezone(timedelta(hours=5)))
+    response = client.get(
+        "api/issue/list?projectID=%s&created_after=%s" % (project_id, hour_ago.isoformat().replace("+", "%2B")),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert len(data["issues"]) == 5
+
+def test_issue_list_out_of_range_project(client, auth_token_new_1):
+    """
+    Tests /issue/list API using a project id beyond the range of SQLite integers
+    """
+    response = client.get(
+        "api/issue/list?projectID=99999999999999999999999",
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    assert response.status_code == 400
+
+'''
+    Tests For Export
+'''
+def test_project_export_streams_ndjson(client, auth_token_new_1):
+    """
+    Tests /project/export API: every live project and issue of the user is exported
+    """
+    response = client.get(
+        "api/project/export",
+        headers={"authorization":auth_token_new_1})
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert {"type": "project", "project_name": "list_proj"}.items() <= next(
+        line for line in lines if line.get("project_name") == "list_proj").items()
+    assert len([line for line in lines if line["type"] == "issue" and line["issue_title"].startswith("listed_")]) == 5
+    assert not any(line.get("deleted") for line in lines)
+
+def test_project_export_since_includes_tombstones(client, auth_token_new_1):
+    """
+    Tests /project/export API: incremental export returns changed rows and deletions only
+    """
+    headers = {"authorization":auth_token_new_1}
+    since = datetime.utcnow().isoformat()
+    with app.app_context():
+        project_id = Project.query.filter_by(project_name="list_proj", deleted=False).first().id
+    client.delete(
+        "api/project/delete",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json")
+    response = client.get(
+        "api/project/export?since=" + since,
+        headers=headers)
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert response.status_code == 200
+    assert len(lines) == 6
+    assert all(line["deleted"] for line in lines)
+
+'''
+    Tests For Bulk Issue Operations
+'''
+def test_issue_bulk_create(client, auth_token_new_1, monkeypatch):
+    """
+    Tests /issue/bulkcreate API: accessible items are created in one transaction, others are reported
+    """
+    monkeypatch.setitem(app.config, "DEBUG_COMMIT_COUNT", True)
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "bulk_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    items = [{"issue_title": "bulk_" + str(i), "issue_type": "Feature", "parent_project": str(project_id)} for i in range(3)]
+    items.insert(1, {"issue_title": "bulk_denied", "issue_type": "Bug", "parent_project": "1"})
+    response = client.post(
+        "api/issue/bulkcreate",
+        data=json.dumps({"issues": items}),
+        headers=headers,
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert response.headers["X-DB-Commits"] == "1"
+    assert [result["success"] for result in data["results"]] == [True, False, True, True]
+    with app.app_context():
+        for result, item in zip(data["results"], items):
+            if result["success"]:
+                assert Issue.get_by_id(result["issueID"]).issue_title == item["issue_title"]
+        assert Project.query.get(project_id).number_of_issues == 3
+
+def test_issue_bulk_create_invalid_item(client, auth_token_new_1):
+    """
+    Tests /issue/bulkcreate API: every item is validated against the issue create model
+    """
+    response = client.post(
+        "api/issue/bulkcreate",
+        data=json.dumps({"issues": [{"issue_title": "bulk_bad", "issue_type": "Abc_type", "parent_project": "1"}]}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "'Abc_type' is not one of ('Bug', 'Improvement', 'Feature')" in data["msg"]
+
+def test_issue_bulk_create_malformed_project_ids(client, auth_token_new_1):
+    """
+    Tests /issue/bulkcreate API: project ids that are not plain integers fail per item
+    """
+    issues = [{"issue_title": "bulk_bad_id", "issue_type": "Bug", "parent_project": parent}
+              for parent in ("\u00b2", "99999999999999999999999")]
+    response = client.post(
+        "api/issue/bulkcreate",
+        data=json.dumps({"issues": issues}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert [result["success"] for result in data["results"]] == [False, False]
+
+def test_issue_bulk_edit_moves_and_closes(client, auth_token_new_1, monkeypatch):
+    """
+    Tests /issue/bulkedit API: status change and project move of listed issues in one transaction
+    """
+    monkeypatch.setitem(app.config, "DEBUG_COMMIT_COUNT", True)
+    headers = {"authorization":auth_token_new_1}
+    target_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "bulk_target"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    with app.app_context():
+        source = Project.query.filter_by(project_name="bulk_proj", deleted=False).first()
+        source_id = source.id
+        issue_ids = [str(issue.id) for issue in Issue.get_issues_by_project_id(source_id).limit(2)]
+    response = client.post(
+        "api/issue/bulkedit",
+        data=json.dumps({"issueIDs": issue_ids, "issue_status": "Done", "parent_project": str(target_id)}),
+        headers=headers,
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["updated"] == 2
+    assert response.headers["X-DB-Commits"] == "1"
+    with app.app_context():
+        assert Project.query.get(source_id).number_of_issues == 1
+        assert Project.query.get(target_id).number_of_issues == 2
+        assert {issue.issue_status for issue in Issue.get_issues_by_project_id(target_id)} == {"Done"}
+
+def test_issue_bulk_edit_by_filter(client, auth_token_new_1):
+    """
+    Tests /issue/bulkedit API: changes applied to the issues matching a filter
+    """
+    headers = {"authorization":auth_token_new_1}
+    with app.app_context():
+        target_id = Project.query.filter_by(project_name="bulk_target", deleted=False).first().id
+    response = client.post(
+        "api/issue/bulkedit",
+        data=json.dumps({"filter": {"projectID": str(target_id), "issue_status": "Done"}, "issue_type": "Improvement"}),
+        headers=headers,
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["updated"] == 2
+
+def test_issue_bulk_edit_out_of_scope_issue(client, auth_token_new_1):
+    """
+    Tests /issue/bulkedit API: nothing changes when one of the issues is out of scope
+    """
+    response = client.post(
+        "api/issue/bulkedit",
+        data=json.dumps({"issueIDs": ["1"], "issue_status": "Done"}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 404
+    assert "Some issues cannot be reached since user has no access to them" in data["msg"]
+
+def test_issue_bulk_edit_malformed_issue_ids(client, auth_token_new_1):
+    """
+    Tests /issue/bulkedit API: issue ids that are not plain integers cannot be reached
+    """
+    for issue_id in ("\u00b2", "99999999999999999999999"):
+        response = client.post(
+            "api/issue/bulkedit",
+            data=json.dumps({"issueIDs": [issue_id], "issue_status": "Done"}),
+            headers={"authorization":auth_token_new_1},
+            content_type="application/json")
+
+        assert response.status_code == 404
+
+def test_issue_bulk_edit_filter_out_of_scope_project(client, auth_token_new_1):
+    """
+    Tests /issue/bulkedit API: a filter on a project outside the scope of the user is not found
+    """
+    response = client.post(
+        "api/issue/bulkedit",
+        data=json.dumps({"filter": {"projectID": "999999"}, "issue_status": "Done"}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 404
+    assert "No such project found in the scope of this user" in data["msg"]
+
+'''
+    Tests For Issue Search
+'''
+def test_issue_search_ranked_and_scoped(client, auth_token_new_1):
+    """
+    Tests /issue/search API: prefix matches of live issues in the user's projects
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "search_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    issue_ids = {}
+    for title in ("login crash", "crash on logout", "slow login page"):
+        issue_ids[title] = json.loads(client.post(
+            "api/issue/create",
+            data=json.dumps({"issue_title": title, "issue_type": "Bug", "parent_project": str(project_id)}),
+            headers=headers,
+            content_type="application/json").data.decode())["issueID"]
+    client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_ids["slow login page"]), "issue_title": "slow signin page"}),
+        headers=headers,
+        content_type="application/json")
+    client.delete(
+        "api/issue/delete",
+        data=json.dumps({"issueID": str(issue_ids["crash on logout"])}),
+        headers=headers,
+        content_type="application/json")
+
+    response = client.get(
+        "api/issue/search?q=crash&limit=10",
+        headers=headers)
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert [issue["_id"] for issue in data["issues"]] == [issue_ids["login crash"]]
+
+    response = client.get(
+        "api/issue/search?q=sign pa",
+        headers=headers)
+    data = json.loads(response.data.decode())
+    assert [issue["_id"] for issue in data["issues"]] == [issue_ids["slow login page"]]
+
+def test_issue_search_other_user(client):
+    """
+    Tests /issue/search API: issues of other users are never returned
+    """
+    credentials = {"email": "search@apple.com", "password": DUMMY_PASS}
+    client.post(
+        "api/users/register",
+        data=json.dumps(dict(credentials, username="searcher")),
+        content_type="application/json")
+    token = json.loads(client.post(
+        "api/users/login",
+        data=json.dumps(credentials),
+        content_type="application/json").data.decode())["token"]
+    response = client.get(
+        "api/issue/search?q=crash",
+        headers={"authorization":token})
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["issues"] == []
+
+def test_issue_search_out_of_range_page(client, auth_token_new_1):
+    """
+    Tests /issue/search API: a page whose offset is beyond the range of SQLite integers
+    """
+    response = client.get(
+        "api/issue/search?q=crash&page=99999999999999999999",
+        headers={"authorization":auth_token_new_1})
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Page number is out of range" in data["msg"]
+
+'''
+    Tests For Issue Statistics
+'''
+def test_project_stats_follow_issue_changes(client, auth_token_new_1):
+    """
+    Tests /project/stats API: counts by status and type follow create, edit, move and delete
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_ids = [json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": name}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"] for name in ("stats_proj", "stats_target")]
+    issue_ids = [json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": title, "issue_type": issue_type, "parent_project": str(project_ids[0])}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"]
+        for title, issue_type in (("stats one", "Bug"), ("stats two", "Bug"), ("stats three", "Feature"))]
+    client.post(
+        "api/issue/bulkcreate",
+        data=json.dumps({"issues": [{"issue_title": "stats four", "issue_type": "Improvement",
+                                     "parent_project": str(project_ids[0])}]}),
+        headers=headers,
+        content_type="application/json")
+    client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_ids[0]), "issue_status": "Done"}),
+        headers=headers,
+        content_type="application/json")
+    client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_ids[1]), "parent_project": str(project_ids[1])}),
+        headers=headers,
+        content_type="application/json")
+    client.delete(
+        "api/issue/delete",
+        data=json.dumps({"issueID": str(issue_ids[2])}),
+        headers=headers,
+        content_type="application/json")
+
+    response = client.get(
+        f"api/project/stats?projectID={project_ids[0]}",
+        headers=headers)
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert data["projects"] == [{"_id": project_ids[0], "project_name": "stats_proj", "number_of_issues": 2,
+                                 "by_status": {"Done": 1, "To Do": 1}, "by_type": {"Bug": 1, "Improvement": 1}}]
+
+    response = client.get(
+        "api/project/stats",
+        headers=headers)
+    data = json.loads(response.data.decode())
+    stats = {project["_id"]: project for project in data["projects"]}
+    assert stats[project_ids[1]]["by_status"] == {"To Do": 1}
+    assert stats[project_ids[1]]["by_type"] == {"Bug": 1}
+
+def test_project_stats_out_of_scope(client, auth_token_new_1):
+    """
+    Tests /project/stats API: a deleted project is not found
+    """
+    response = client.get(
+        "api/project/stats?projectID=1",
+        headers={"authorization":auth_token_new_1})
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 404
+    assert data["success"] == False
+
+def test_reconcile_issue_breakdown_command():
+    """
+    Tests that the reconcile command repairs drifted breakdown counts
+    """
+    with app.app_context():
+        project_id = Project.query.filter_by(project_name="stats_proj").first().id
+        db.session.query(IssueBreakdown).filter_by(project_id=project_id, issue_status="Done") \
+                  .update({IssueBreakdown.issue_count: 7})
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["reconcile-issue-breakdown"])
+
+    assert "Corrected 1 issue breakdown rows" in result.output
+    with app.app_context():
+        assert db.session.query(IssueBreakdown.issue_count) \
+                         .filter_by(project_id=project_id, issue_status="Done").scalar() == 1
+
+'''
+    Tests For Conditional Requests
+'''
+def test_project_view_etag_not_modified(client, auth_token_new_1):
+    """
+    Tests /project/view API: If-None-Match with the current ETag returns 304, an edit changes the ETag
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "etag_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    view = lambda extra_headers: client.get(
+        "api/project/view",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=dict(headers, **extra_headers),
+        content_type="application/json")
+
+    etag = view({}).headers["ETag"]
+    response = view({"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "etag issue", "issue_type": "Bug", "parent_project": str(project_id)}),
+        headers=headers,
+        content_type="application/json")
+    response = view({"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_project_edit_if_match(client, auth_token_new_1):
+    """
+    Tests /project/edit API: a stale If-Match is rejected with 412, the current one is accepted
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "if_match_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    etag = client.get(
+        "api/project/view",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json").headers["ETag"]
+    edit = lambda name, if_match: client.post(
+        "api/project/edit",
+        data=json.dumps({"projectID": str(project_id), "project_name": name}),
+        headers=dict(headers, **{"If-Match": if_match}),
+        content_type="application/json")
+
+    response = edit("if_match_proj_2", etag)
+    assert response.status_code == 200
+    response = edit("if_match_proj_3", etag)
+    data = json.loads(response.data.decode())
+    assert response.status_code == 412
+    assert data["success"] == False
+    with app.app_context():
+        assert Project.query.get(project_id).project_name == "if_match_proj_2"
+
+def test_issue_list_etag_changes_with_issues(client, auth_token_new_1):
+    """
+    Tests /issue/list API: the list ETag answers 304 until an issue of the page changes
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "etag_list_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    issue_id = json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "etag list", "issue_type": "Bug", "parent_project": str(project_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"]
+    url = f"api/issue/list?projectID={project_id}"
+
+    etag = client.get(url, headers=headers).headers["ETag"]
+    assert client.get(url, headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+
+    response = client.post(
+        "api/issue/edit",
+        data=json.dumps({"issueID": str(issue_id), "issue_status": "Done"}),
+        headers=dict(headers, **{"If-Match": '"issue-%d-v1"' % issue_id}),
+        content_type="application/json")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"issue-%d-v2"' % issue_id
+    assert client.get(url, headers=dict(headers, **{"If-None-Match": etag})).status_code == 200
+
+'''
+    Tests For Read Cache
+'''
+def test_project_view_cached_until_edit(client, auth_token_new_1):
+    """
+    Tests that repeated project views are served from the read cache and an edit invalidates them
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "cached_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    view = lambda: json.loads(client.get(
+        "api/project/view",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())
+    read_hits = lambda: json.loads(client.get(
+        "api/metrics/cache",
+        headers=headers).data.decode())["read_cache"]["hits"]
+
+    view()
+    hits = read_hits()
+    assert view()["project"]["project_name"] == "cached_proj"
+    assert read_hits() == hits + 1
+
+    client.post(
+        "api/project/edit",
+        data=json.dumps({"projectID": str(project_id), "project_name": "cached_proj_2"}),
+        headers=headers,
+        content_type="application/json")
+    assert view()["project"]["project_name"] == "cached_proj_2"
+    listed = json.loads(client.get("api/project/listall", headers=headers).data.decode())["projects"]
+    assert "cached_proj_2" in [project["project_name"] for project in listed]
+
+def test_issue_view_cache_invalidated_by_bulk_edit(client, auth_token_new_1):
+    """
+    Tests that a cached issue view is dropped when a bulk edit changes the issue
+    """
+    headers = {"authorization":auth_token_new_1}
+    project_id = json.loads(client.post(
+        "api/project/create",
+        data=json.dumps({"project_name": "cached_issue_proj"}),
+        headers=headers,
+        content_type="application/json").data.decode())["projectID"]
+    issue_id = json.loads(client.post(
+        "api/issue/create",
+        data=json.dumps({"issue_title": "cached issue", "issue_type": "Bug", "parent_project": str(project_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())["issueID"]
+    view = lambda: json.loads(client.get(
+        "api/issue/view",
+        data=json.dumps({"issueID": str(issue_id)}),
+        headers=headers,
+        content_type="application/json").data.decode())
+
+    assert view()["issue"]["issue_status"] == "To Do"
+    client.post(
+        "api/issue/bulkedit",
+        data=json.dumps({"filter": {"projectID": str(project_id)}, "issue_status": "Done"}),
+        headers=headers,
+        content_type="application/json")
+    assert view()["issue"]["issue_status"] == "Done"
+
+    client.delete(
+        "api/project/delete",
+        data=json.dumps({"projectID": str(project_id)}),
+        headers=headers,
+        content_type="application/json")
+    assert view()["success"] == False
+
+'''
+    Tests For Shared Cache
+'''
+def test_shared_cache_between_workers(tmp_path):
+    """
+    Tests that an entry set by one worker is read by another and a tag invalidation reaches both
+    """
+    path = str(tmp_path / "cache.db")
+    worker_1 = SharedCache(path, "read", maxsize=16, ttl=30, sync_interval=0)
+    worker_2 = SharedCache(path, "read", maxsize=16, ttl=30, sync_interval=0)
+
+    worker_1.set("project:1:1", {"project_name": "shared"}, tags=("project:1",))
+    assert worker_2.get("project:1:1") == {"project_name": "shared"}
+    assert worker_2.get("project:1:1") == {"project_name": "shared"}
+    assert worker_2.stats()["local"]["hits"] == 1
+
+    worker_1.invalidate_tag("project:1")
+    assert worker_2.get("project:1:1") is None
+    assert worker_1.get("project:1:1") is None
+
+def test_shared_cache_namespaces_and_size(tmp_path):
+    """
+    Tests that namespaces of a shared cache file are separate and the size bound is enforced
+    """
+    path = str(tmp_path / "cache.db")
+    tokens = SharedCache(path, "token", maxsize=8, ttl=30, sync_interval=0)
+    reads = SharedCache(path, "read", maxsize=8, ttl=30, sync_interval=0)
+
+    tokens.set("key", 1)
+    assert reads.get("key") is None
+    for number in range(16):
+        reads.set(f"key:{number}", number)
+
+    assert reads.stats()["size"] <= 8
+    assert tokens.get("key") == 1
+
+'''
+    Tests For JSON Representation
+'''
+def test_validation_error_envelope(client):
+    """
+    Tests that payload validation errors are sent as {"success", "msg"} with a single content type
+    """
+    response = client.post(
+        "api/users/register",
+        data=json.dumps({"username": DUMMY_USERNAME}),
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert data == {"success": False, "msg": "'email' is a required property"}
+    assert response.headers.get_all("Content-Type") == ["application/json"]
+
+def test_unknown_route_not_found(client):
+    """
+    Tests that a request to an unknown route is answered with 404
+    """
+    response = client.get("api/unknown")
+
+    assert response.status_code == 404
+
+'''
+    Tests For Column Projected Lists
+'''
+def test_list_columns_serialize_like_instances():
+    """
+    Tests that rows of the list columns serialize to the same dicts as ORM instances
+    """
+    with app.app_context():
+        for model in (Project, Issue):
+            query = model.query.order_by(model.id).limit(20)
+            assert [model.serialize(row) for row in model.with_list_columns(query).all()] == \
+                   [instance.toJSON() for instance in query.all()]
+
+'''
+    Tests For Fragment Cache
+'''
+def test_fragment_cache_versions_and_size():
+    """
+    Tests that a new row version replaces the cached fragment and the byte bound is enforced
+    """
+    fragments = FragmentCache(max_bytes=64)
+
+    assert json.loads(fragments.get("issue", 1, 1, lambda: {"issue_title": "first"})) == {"issue_title": "first"}
+    assert json.loads(fragments.get("issue", 1, 1, lambda: {"issue_title": "ignored"})) == {"issue_title": "first"}
+    assert json.loads(fragments.get("issue", 1, 2, lambda: {"issue_title": "edited"})) == {"issue_title": "edited"}
+    assert fragments.stats()["size"] == 1
+
+    for issue_id in range(2, 10):
+        fragments.get("issue", issue_id, 1, lambda: {"issue_title": "x" * 10})
+    assert fragments.stats()["size_bytes"] <= 64
+    assert fragments.stats()["evictions"] > 0
+
+'''
+    Tests For Response Compression
+'''
+def test_list_gzip_compressed(client, auth_token_new_1, monkeypatch):
+    """
+    Tests that a list response is gzip compressed on request and its ETag still answers 304
+    """
+    monkeypatch.setitem(app.config, "COMPRESS_MIN_SIZE", 64)
+    headers = {"authorization":auth_token_new_1}
+
+    plain = client.get("api/project/listall", headers=headers)
+    response = client.get("api/project/listall", headers=dict(headers, **{"Accept-Encoding": "gzip"}))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == json.loads(plain.data)
+    assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+    response = client.get("api/project/listall",
+                          headers=dict(headers, **{"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}))
+    assert response.status_code == 304
+
+def test_small_response_not_compressed(client, auth_token_new_1):
+    """
+    Tests that responses below the size threshold are sent uncompressed but vary on Accept-Encoding
+    """
+    response = client.get(
+        "api/metrics/blocklist",
+        headers={"authorization":auth_token_new_1, "Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(response.data)["success"] == True
+
+def test_export_stream_gzip_compressed(client, auth_token_new_1):
+    """
+    Tests that the streamed NDJSON export is compressed as it is generated
+    """
+    headers = {"authorization":auth_token_new_1}
+
+    plain = client.get("api/project/export", headers=headers).data
+    response = client.get("api/project/export", headers=dict(headers, **{"Accept-Encoding": "gzip;q=1, br;q=0"}))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data) == plain
+
+def test_revocation_filter_sees_revocations_after_purge(client):
+    """
+    Tests that revocations made after the blocklist was purged reach the filters of other workers
+    """
+    sibling = RevocationFilter(100, 0.01, 0)
+    with app.app_context():
+        db.session.add(JWTTokenBlocklist(token_hash="e" * 64, expires_at=datetime(2000, 1, 1)))
+        db.session.commit()
+        sibling.sync()
+        JWTTokenBlocklist.purge_expired()
+
+        db.session.add(JWTTokenBlocklist(token_hash="f" * 64, expires_at=datetime(2100, 1, 1)))
+        db.session.commit()
+
+        assert sibling.might_be_revoked("f" * 64)
+
+def test_revocation_filter_not_rebuilt_above_capacity(client):
+    """
+    Tests that a filter sized for more revocations than its configured capacity is not rebuilt on every sync
+    """
+    revocations = RevocationFilter(10, 0.01, 0)
+    with app.app_context():
+        for i in range(20):
+            db.session.add(JWTTokenBlocklist(token_hash=f"{i:064x}", expires_at=datetime(2100, 1, 1)))
+        db.session.commit()
+
+        for _ in range(5):
+            revocations.might_be_revoked("0" * 64)
+
+    assert revocations.rebuilds == 1
+
+def test_issue_list_plans_use_covering_indexes(client):
+    """
+    Tests that filtered issue pages in every sort order are read from a covering index without a temporary sort
+    """
+    with app.app_context():
+        for sort in ('id', '-id', 'date_created', '-date_created'):
+            for filters in ({}, {"issue_type": "Bug", "created_by": 1}, {"created_after": datetime(2020, 1, 1)}):
+                query = Issue.with_list_columns(Issue.get_page_by_project(1, 50, sort=sort, **filters), 'date_created')
+                sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+                plan = ' '.join(row[3] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+
+                assert "COVERING INDEX" in plan
+                assert "TEMP B-TREE" not in plan
+
+def test_user_edit_username_taken_concurrently(client, auth_token_new_1, monkeypatch):
+    """
+    Tests /users/edit API: a username taken after the lookup is refused by the unique index
+    """
+    monkeypatch.setattr(Users, "get_by_username", classmethod(lambda cls, username: None))
+    response = client.post(
+        "api/users/edit",
+        data=json.dumps({"username": "searcher"}),
+        headers={"authorization":auth_token_new_1},
+        content_type="application/json")
+
+    data = json.loads(response.data.decode())
+    assert response.status_code == 400
+    assert "Username already taken" in data["msg"]